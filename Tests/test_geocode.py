@@ -12,30 +12,105 @@ Jamie Taylor & Ethan Jones 2020-05-22
 import sys
 import os
 import unittest
+import tempfile
 from pathlib import Path
 
+import numpy as np
 from numpy.testing import assert_almost_equal, assert_equal
 
 # sys.path.append("../geocode/")
 from geocode import Geocoder
 
-class geocodeTestCase(unittest.TestCase):
-    """Tests for `geocode.py`."""
+def count_cache_files(cache_dir):
+    """Count the (non-GMaps) cache files in `cache_dir`."""
+    with os.scandir(cache_dir) as entries:
+        return sum(1 for e in entries
+                   if e.name.endswith((".p", ".p.zst", ".feather", ".parquet")) and "gmaps" not in e.name)
+
+class cacheTestCase(unittest.TestCase):
+    """Tests for `geocode.py` which modify the cache (each test uses its own cache directory)."""
+    def setUp(self):
+        """Create an empty, temporary cache directory."""
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self._tmp.name)
+
+    def tearDown(self):
+        """Delete the temporary cache directory."""
+        self._tmp.cleanup()
+
     def test_clear_cache(self):
         """Test the `cache_manager.clear()` method."""
-        with Geocoder() as geo:
+        with Geocoder(cache_dir=self.cache_dir) as geo:
+            geo.cache_manager.write("llsoa_centroids", {"E01012082": (54.5, -1.2)})
+            geo.cache_manager.write("gmaps_cache", {})
+            self.assertEqual(count_cache_files(self.cache_dir), 1)
             geo.cache_manager.clear(delete_gmaps_cache=False)
-        cache_dir = geo.cache_manager.cache_dir
-        assert cache_dir.is_dir()
-        assert len([c for c in cache_dir.glob("*.p") if "gmaps" not in c.name]) == 0
-
+        assert self.cache_dir.is_dir()
+        self.assertEqual(count_cache_files(self.cache_dir), 0)
+        assert geo.cache_manager.retrieve("gmaps_cache") == {}
+
+    def test_release_cache(self):
+        """Test that retrieved cache contents are shared until `cache_manager.release()`."""
+        with Geocoder(cache_dir=self.cache_dir) as geo:
+            geo.cache_manager.write("llsoa_centroids", {"E01012082": (54.5, -1.2)})
+            contents = geo.cache_manager.retrieve("llsoa_centroids")
+            assert geo.cache_manager.retrieve("llsoa_centroids") is contents
+        assert geo.cache_manager.retrieve("llsoa_centroids") is not contents
+        self.assertEqual(geo.cache_manager.retrieve("llsoa_centroids"), contents)
+
+    def test_stale_buffers(self):
+        """Test that a pickle is never loaded with the buffers file written for other data."""
+        with Geocoder(cache_dir=self.cache_dir) as geo:
+            geo.cache_manager.write("constituency_centroids", np.zeros(1000))
+            pickle_file = next(self.cache_dir.glob("constituency_centroids_*.p*"))
+            old_pickle = pickle_file.read_bytes()
+            geo.cache_manager.write("constituency_centroids", np.ones(1000))
+            self.assertEqual(len(list(self.cache_dir.glob("constituency_centroids_*.buffers"))), 1)
+            pickle_file.write_bytes(old_pickle)
+            assert geo.cache_manager.retrieve("constituency_centroids") is None
+
+    def test_clear_old_gmaps_cache(self):
+        """Test clearing old GMaps caches after old versions have already been cleared."""
+        with Geocoder(cache_dir=self.cache_dir) as geo:
+            old_gmaps_cache = self.cache_dir.joinpath("gmaps_cache_0-0-1.p")
+            old_gmaps_cache.write_bytes(b"")
+            geo.cache_manager.clear(delete_gmaps_cache=False, old_versions_only=True)
+            assert old_gmaps_cache.is_file()
+            geo.cache_manager.clear(delete_gmaps_cache=True, old_versions_only=True)
+            assert not old_gmaps_cache.is_file()
+
+    def test_migrate_gmaps_cache(self):
+        """Test that entries in a legacy (pickled) GMaps cache are still hit after migration."""
+        def result(lat, lon):
+            return [{"geometry": {"location": {"lat": lat, "lng": lon}, "location_type": "ROOFTOP"},
+                     "types": ["premise"]}]
+        with Geocoder(cache_dir=self.cache_dir) as geo:
+            geo.cache_manager.write("gmaps_cache", {"Hicks Building, S3 7RH": result(53.38, -1.49),
+                                                    "Hicks Building, Sheffield": result(53.4, -1.5)})
+            results = geo.gmaps.geocode_postcode(["s3  7rh", None],
+                                                 ["hicks building", " Hicks Building, sheffield"])
+        assert_equal([tuple(r) for r in results], [(53.38, -1.49, 3), (53.4, -1.5, 3)])
+
+    @unittest.skipUnless(os.environ.get("GEOCODE_FULL_TESTS"),
+                         "Set GEOCODE_FULL_TESTS to run (downloads all datasets)")
     def test_force_setup(self):
         """Test the `force_setup()` method."""
-        with Geocoder() as geo:
+        with Geocoder(cache_dir=self.cache_dir) as geo:
             geo.force_setup()
-        cache_dir = geo.cache_manager.cache_dir
-        assert cache_dir.is_dir()
-        assert len([c for c in cache_dir.glob("*.p") if "gmaps" not in c.name]) == 13
+        assert self.cache_dir.is_dir()
+        self.assertEqual(count_cache_files(self.cache_dir), 18)
+
+class geocodeTestCase(unittest.TestCase):
+    """Tests for `geocode.py`."""
+    @classmethod
+    def setUpClass(cls):
+        """Share a single Geocoder instance (and its loaded data) between all tests."""
+        cls.geo = Geocoder().__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Flush the shared Geocoder instance."""
+        cls.geo.__exit__(None, None, None)
 
     def test_geocode_llsoa(self):
         """
@@ -50,8 +125,7 @@ class geocodeTestCase(unittest.TestCase):
             (55.94492620443608, -4.333451009831742),
             (55.91836588770352, -4.21934323024909)
         ]
-        with Geocoder() as geo:
-            assert_almost_equal(geo.geocode_llsoa(llsoas), centroids)
+        assert_almost_equal(self.geo.geocode_llsoa(llsoas), centroids)
 
     def test_reverse_geocode_llsoa(self):
         """
@@ -66,9 +140,8 @@ class geocodeTestCase(unittest.TestCase):
             (53.207256254835059, -3.13247635788833)
         ]
         datazone_latlons = [(55.91836588770352, -4.21934323024909)]
-        with Geocoder() as geo:
-            self.assertEqual(geo.reverse_geocode_llsoa(latlons), llsoas)
-            self.assertEqual(geo.reverse_geocode_llsoa(datazone_latlons, dz=True), datazones)
+        self.assertEqual(self.geo.reverse_geocode_llsoa(latlons), llsoas)
+        self.assertEqual(self.geo.reverse_geocode_llsoa(datazone_latlons, dz=True), datazones)
 
     def test_reverse_geocode_nuts(self):
         """
@@ -83,11 +156,10 @@ class geocodeTestCase(unittest.TestCase):
             (47.9995, 0.2335),
             (50.8356, 8.7343)
         ]
-        with Geocoder() as geo:
-            self.assertEqual(geo.reverse_geocode_nuts(latlons, level=3), nuts3)
-            self.assertEqual(geo.reverse_geocode_nuts(latlons, level=2), nuts2)
-            self.assertEqual(geo.reverse_geocode_nuts(latlons, level=1), nuts1)
-            self.assertEqual(geo.reverse_geocode_nuts(latlons, level=0), nuts0)
+        self.assertEqual(self.geo.reverse_geocode_nuts(latlons, level=3), nuts3)
+        self.assertEqual(self.geo.reverse_geocode_nuts(latlons, level=2), nuts2)
+        self.assertEqual(self.geo.reverse_geocode_nuts(latlons, level=1), nuts1)
+        self.assertEqual(self.geo.reverse_geocode_nuts(latlons, level=0), nuts0)
 
     def test_reverse_geocode_gsp(self):
         """
@@ -98,8 +170,7 @@ class geocodeTestCase(unittest.TestCase):
             (53.33985, -2.051880),
             (55.950095, -3.178485)
         ]
-        with Geocoder() as geo:
-            assert_equal(geo.reverse_geocode_gsp(latlons), gsp_regions)
+        assert_equal(self.geo.reverse_geocode_gsp(latlons), gsp_regions)
 
     def test_geocode_constituency(self):
         """
@@ -110,8 +181,7 @@ class geocodeTestCase(unittest.TestCase):
             (51.507938, -0.015729999),
             (55.092758, -1.56095)
         ]
-        with Geocoder() as geo:
-            assert_almost_equal(geo.geocode_constituency(constituencies), latlons)
+        assert_almost_equal(self.geo.geocode_constituency(constituencies), latlons)
 
     def test_geocode_local_authority(self):
         """
@@ -123,8 +193,7 @@ class geocodeTestCase(unittest.TestCase):
             (54.15731, -3.1998999),
             (54.80904, -7.42064)
         ]
-        with Geocoder() as geo:
-           assert_almost_equal(geo.geocode_local_authority(lads), latlons)
+        assert_almost_equal(self.geo.geocode_local_authority(lads), latlons)
 
     def test_geocode_postcode(self):
         """
@@ -136,8 +205,21 @@ class geocodeTestCase(unittest.TestCase):
             (53.37708, -1.48700, 1),
             (53.85414,-3.02139, 1)
         ]
-        with Geocoder() as geo:
-           assert_almost_equal(geo.geocode_postcode(postcodes).tolist(), latlons, decimal=4)
+        assert_almost_equal(self.geo.geocode_postcode(postcodes).tolist(), latlons, decimal=4)
+        postcodes = [" rg1 3pe", "s10  2FR", "FY20SQ"]
+        assert_almost_equal(self.geo.geocode_postcode(postcodes).tolist(), latlons, decimal=4)
+
+    def test_bng2latlon(self):
+        """
+        Test the `_bng2latlon()` method with array and scalar inputs.
+        """
+        eastings = [435000, 530000, 326000]
+        northings = [387000, 180000, 674000]
+        lons = [-1.47533, -0.12835, -3.18665]
+        lats = [53.37870, 51.50399, 55.95331]
+        assert_almost_equal(self.geo._bng2latlon(eastings, northings), (lons, lats), decimal=4)
+        assert_almost_equal(self.geo._bng2latlon(eastings[0], northings[0]), (lons[0], lats[0]),
+                            decimal=4)
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,8 @@
 import os
 import logging
 
+import pandas as pd
+
 from geocode import Geocoder
 
 def main():
@@ -9,44 +11,46 @@ def main():
         print("GEOCODE POSTCODES / ADDRESSES:")
         postcodes = ["S3 7RH", "S3 7", "S3", None, None, "S3 7RH"]
         addresses = [None, None, None, "Hicks Building, Sheffield", "Hicks", "Hicks Building"]
-        results = geocoder.geocode(postcodes, "postcode", address=addresses)
-        for postcode, address, (lat, lon, status) in zip(postcodes, addresses, results):
-            print(f"    Postcode + Address: `{postcode}` + `{address}`  ->  {lat:.3f}, {lon:.3f} "
-                  f"({geocoder.status_codes[status]})")
+        results = pd.DataFrame(list(geocoder.geocode(postcodes, "postcode", address=addresses)),
+                               columns=["latitude", "longitude", "match_status"])
+        results.insert(0, "postcode", postcodes)
+        results.insert(1, "address", addresses)
+        results["match_status"] = results.match_status.astype(int).map(geocoder.status_codes)
+        print(results.to_string(float_format="%.3f"))
         # Geocode some LLSOAs...
         print("GEOCODE LLSOAs:")
         llsoas = ["E01033264", "E01033262"]
-        results = geocoder.geocode_llsoa(llsoas)
-        for llsoa, (lat, lon) in zip(llsoas, results):
-            print(f"    LLSOA: `{llsoa}`  ->  {lat:.3f}, {lon:.3f}")
+        results = pd.DataFrame(geocoder.geocode_llsoa(llsoas), columns=["latitude", "longitude"])
+        results.insert(0, "llsoa", llsoas)
+        print(results.to_string(float_format="%.3f"))
         # Geocode some Constituencies...
         print("GEOCODE CONSTITUENCIES:")
         constituencies = ["Sheffield Central", "Sheffield Hallam"]
-        results = geocoder.geocode_constituency(constituencies)
-        for constituency, (lat, lon) in zip(constituencies, results):
-            print(f"    Constituency: `{constituency}`  ->  {lat:.3f}, {lon:.3f}")
+        results = pd.DataFrame(geocoder.geocode_constituency(constituencies),
+                               columns=["latitude", "longitude"])
+        results.insert(0, "constituency", constituencies)
+        print(results.to_string(float_format="%.3f"))
         # Reverse-geocode some lat/lons to LLSOAs...
         print("REVERSE-GEOCODE TO LLSOA:")
-        latlons = [(53.384, -1.467), (53.388, -1.470)]
-        results = geocoder.reverse_geocode_llsoa(latlons)
-        for llsoa, (lat, lon) in zip(results, latlons):
-            print(f"    LATLON: {lat:.3f}, {lon:.3f}  ->  {llsoa}")
+        latlons = pd.DataFrame([(53.384, -1.467), (53.388, -1.470)],
+                               columns=["latitude", "longitude"])
+        results = latlons.assign(llsoa=geocoder.reverse_geocode_llsoa(latlons.to_numpy()))
+        print(results.to_string(float_format="%.3f"))
         # Reverse-geocode some lat/lons to GSP...
         print("REVERSE-GEOCODE TO GSP:")
-        latlons = [(53.384, -1.467), (53.388, -1.470)]
-        results = geocoder.reverse_geocode_gsp(latlons)
-        for (lat, lon), region_id in zip(latlons, results):
-            print(f"    LATLON: {lat:.3f}, {lon:.3f}  ->  {region_id}")
+        results = latlons.assign(gsp=geocoder.reverse_geocode_gsp(latlons.to_numpy()))
+        print(results.to_string(float_format="%.3f"))
         # Reverse-geocode some lat/lons to 2021 NUTS2...
         print("REVERSE-GEOCODE TO NUTS2:")
-        latlons = [(51.3259, -1.9613), (47.9995, 0.2335), (50.8356, 8.7343)]
-        results = geocoder.reverse_geocode_nuts(latlons, year=2021, level=2)
-        for (lat, lon), nuts2 in zip(latlons, results):
-            print(f"    LATLON: {lat:.3f}, {lon:.3f}  ->  {nuts2}")
+        latlons = pd.DataFrame([(51.3259, -1.9613), (47.9995, 0.2335), (50.8356, 8.7343)],
+                               columns=["latitude", "longitude"])
+        results = latlons.assign(nuts2=geocoder.reverse_geocode_nuts(latlons.to_numpy(), year=2021,
+                                                                     level=2))
+        print(results.to_string(float_format="%.3f"))
 
 if __name__ == "__main__":
     log_fmt = "%(asctime)s [%(levelname)s] [%(filename)s:%(funcName)s] - %(message)s"
     fmt = os.environ.get("GEOCODE_LOGGING_FMT", log_fmt)
     datefmt = os.environ.get("GEOCODE_LOGGING_DATEFMT", "%Y-%m-%dT%H:%M:%SZ")
     logging.basicConfig(format=fmt, datefmt=datefmt, level=os.environ.get("LOGLEVEL", "WARNING"))
-    main()
\ No newline at end of file
+    main()
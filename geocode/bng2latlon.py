@@ -12,6 +12,7 @@ import argparse
 import time as TIME
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 from geocode import Geocoder
@@ -43,10 +44,12 @@ def parse_options():
 def main():
     timerstart = TIME.time()
     options = parse_options()
-    with open(options.infile, "r") as fid:
-        df = pd.read_csv(fid)
+    df = pd.read_csv(options.infile, dtype={"eastings": np.float64, "northings": np.float64},
+                     engine="c")
+    eastings = np.ascontiguousarray(df["eastings"].to_numpy(), dtype=np.float64)
+    northings = np.ascontiguousarray(df["northings"].to_numpy(), dtype=np.float64)
     with Geocoder() as geo:
-        lons, lats = geo._bng2latlon(df["eastings"].to_numpy(), df["northings"].to_numpy())
+        lons, lats = geo._bng2latlon(eastings, northings)
     df["latitude"] = lats
     df["longitude"] = lons
     df.to_csv(options.outfile, index=False)
@@ -0,0 +1,155 @@
+"""
+A compiled kernel for converting British National Grid co-ordinates to WGS 1984. This is only used
+by `utilities.bng2latlon()` when the environment variable `GEOCODE_FAST_BNG2LATLON` is set.
+
+- First Authored: 2026-10-15
+"""
+
+from math import sin, cos, tan, sqrt, atan2, radians, degrees
+
+import numpy as np
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+    def njit(*args, **kwargs):
+        """Stand-in for `numba.njit` which leaves the function uncompiled."""
+        return lambda func: func
+
+# Airy 1830 ellipsoid and the National Grid projection
+AIRY_A = 6377563.396
+AIRY_B = 6356256.909
+AIRY_E2 = 1. - AIRY_B ** 2 / AIRY_A ** 2
+AIRY_N = (AIRY_A - AIRY_B) / (AIRY_A + AIRY_B)
+F0 = 0.9996012717
+LAT0 = radians(49.)
+LON0 = radians(-2.)
+N0 = -100000.
+E0 = 400000.
+# WGS 1984 ellipsoid
+WGS84_A = 6378137.
+WGS84_B = 6356752.314245
+WGS84_E2 = 1. - WGS84_B ** 2 / WGS84_A ** 2
+# Helmert transform OSGB 1936 -> WGS 1984 (the inverse of the OS published parameters)
+TX = 446.448
+TY = -125.157
+TZ = 542.060
+S = -20.4894e-6
+RX = radians(0.1502 / 3600.)
+RY = radians(0.2470 / 3600.)
+RZ = radians(0.8421 / 3600.)
+
+@njit(cache=True)
+def _meridional_arc(lat):
+    """Developed meridional arc from the true origin to latitude `lat` (radians)."""
+    n = AIRY_N
+    dlat = lat - LAT0
+    slat = lat + LAT0
+    return AIRY_B * F0 * (
+        (1. + n + 1.25 * n ** 2 + 1.25 * n ** 3) * dlat
+        - (3. * n + 3. * n ** 2 + 2.625 * n ** 3) * sin(dlat) * cos(slat)
+        + (1.875 * n ** 2 + 1.875 * n ** 3) * sin(2. * dlat) * cos(2. * slat)
+        - (35. / 24.) * n ** 3 * sin(3. * dlat) * cos(3. * slat)
+    )
+
+@njit(cache=True)
+def _bng2osgb36(easting, northing):
+    """Inverse Transverse Mercator projection from the National Grid to OSGB 1936 lat/lon."""
+    lat = (northing - N0) / (AIRY_A * F0) + LAT0
+    arc = _meridional_arc(lat)
+    for _ in range(100):
+        if not abs(northing - N0 - arc) >= 1e-5:
+            break
+        lat = (northing - N0 - arc) / (AIRY_A * F0) + lat
+        arc = _meridional_arc(lat)
+    sin_lat = sin(lat)
+    nu = AIRY_A * F0 / sqrt(1. - AIRY_E2 * sin_lat ** 2)
+    rho = AIRY_A * F0 * (1. - AIRY_E2) / (1. - AIRY_E2 * sin_lat ** 2) ** 1.5
+    eta2 = nu / rho - 1.
+    tan_lat = tan(lat)
+    tan2 = tan_lat ** 2
+    tan4 = tan2 ** 2
+    sec_lat = 1. / cos(lat)
+    vii = tan_lat / (2. * rho * nu)
+    viii = tan_lat / (24. * rho * nu ** 3) * (5. + 3. * tan2 + eta2 - 9. * tan2 * eta2)
+    ix = tan_lat / (720. * rho * nu ** 5) * (61. + 90. * tan2 + 45. * tan4)
+    x = sec_lat / nu
+    xi = sec_lat / (6. * nu ** 3) * (nu / rho + 2. * tan2)
+    xii = sec_lat / (120. * nu ** 5) * (5. + 28. * tan2 + 24. * tan4)
+    xiia = sec_lat / (5040. * nu ** 7) * (61. + 662. * tan2 + 1320. * tan4 + 720. * tan4 * tan2)
+    de = easting - E0
+    lat_ = lat - vii * de ** 2 + viii * de ** 4 - ix * de ** 6
+    lon_ = LON0 + x * de - xi * de ** 3 + xii * de ** 5 - xiia * de ** 7
+    return lat_, lon_
+
+@njit(cache=True)
+def _osgb362wgs84(lat, lon):
+    """Helmert transform from OSGB 1936 lat/lon to WGS 1984 lat/lon (all in radians)."""
+    sin_lat = sin(lat)
+    nu = AIRY_A / sqrt(1. - AIRY_E2 * sin_lat ** 2)
+    x1 = nu * cos(lat) * cos(lon)
+    y1 = nu * cos(lat) * sin(lon)
+    z1 = (1. - AIRY_E2) * nu * sin_lat
+    x2 = TX + (1. + S) * x1 - RZ * y1 + RY * z1
+    y2 = TY + RZ * x1 + (1. + S) * y1 - RX * z1
+    z2 = TZ - RY * x1 + RX * y1 + (1. + S) * z1
+    p = sqrt(x2 ** 2 + y2 ** 2)
+    lat_ = atan2(z2, p * (1. - WGS84_E2))
+    for _ in range(100):
+        nu = WGS84_A / sqrt(1. - WGS84_E2 * sin(lat_) ** 2)
+        lat_prev = lat_
+        lat_ = atan2(z2 + WGS84_E2 * nu * sin(lat_), p)
+        if not abs(lat_ - lat_prev) >= 1e-12:
+            break
+    return lat_, atan2(y2, x2)
+
+@njit(cache=True)
+def bng2latlon_scalar(easting, northing):
+    """
+    Convert a single Easting and Northing (OSGB 1936) to longitude and latitude (WGS 1984).
+
+    Parameters
+    ----------
+    `easting` : float
+        Easting co-ordinate.
+    `northing` : float
+        Northing co-ordinate.
+
+    Returns
+    -------
+    tuple
+        Longitude and latitude (floats).
+    """
+    lat, lon = _bng2osgb36(easting, northing)
+    lat, lon = _osgb362wgs84(lat, lon)
+    return degrees(lon), degrees(lat)
+
+@njit(parallel=True, fastmath=True, cache=True)
+def bng2latlon_kernel(eastings, northings, out_lons, out_lats):
+    """
+    Convert Eastings and Northings (OSGB 1936) to longitudes and latitudes (WGS 1984) in place.
+
+    Parameters
+    ----------
+    `eastings` : 1D numpy array of float64
+        Easting co-ordinates.
+    `northings` : 1D numpy array of float64
+        Northing co-ordinates.
+    `out_lons` : 1D numpy array of float64
+        Preallocated output array for the longitudes, same length as `eastings`.
+    `out_lats` : 1D numpy array of float64
+        Preallocated output array for the latitudes, same length as `eastings`.
+
+    Notes
+    -----
+    Uses the OS 7-parameter Helmert transformation, which is the same transformation PROJ uses
+    for EPSG:27700 -> EPSG:4326 when the OSTN15 grid is not available. It is accurate to within
+    about 5 metres.
+    """
+    for i in prange(eastings.shape[0]):
+        lat, lon = _bng2osgb36(eastings[i], northings[i])
+        lat, lon = _osgb362wgs84(lat, lon)
+        out_lons[i] = degrees(lon)
+        out_lats[i] = degrees(lat)
@@ -7,17 +7,135 @@ A generalised cache manager module for the Geocode library.
 """
 
 import os
+import mmap
+import sqlite3
+import struct
 import pickle
-import glob
 import logging
+import uuid
 from pathlib import Path
 import errno
-from typing import Any, Optional
+from typing import Any, Optional, List, Dict, Tuple, Callable, Iterable
+
+import numpy as np
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
 SCRIPT_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
 
 from . version import __version__
 
+# File in the cache directory recording which version's files it holds
+GENERATION_FILE = "GENERATION"
+# Buffer size for reading/writing cache files (much larger than the default 8KB)
+IO_BUFFER_SIZE = 1 << 20
+# Out-of-band pickle buffers are aligned to this many bytes in the sidecar file
+BUFFER_ALIGNMENT = 64
+# Tag of the header pickled ahead of the cached data, naming the generation of its sidecar file
+PICKLE_HEADER = "geocode-cache"
+SQLITE_MAX_VARIABLES = 999
+# Cache contents already loaded by this process, keyed by file path ->
+# (mtime, contents, memory-mapped buffers file or None)
+_LOOKUP_CACHE = {}
+
+def _evict(cache_file: Path):
+    """
+    Remove a cache file's contents from `_LOOKUP_CACHE`, closing the memory-mapped buffers file
+    they were loaded from unless the contents are still in use elsewhere (in which case the map is
+    closed once they are garbage collected).
+    """
+    buffers_map = _LOOKUP_CACHE.pop(cache_file, (None, None, None))[2]
+    if buffers_map is not None:
+        try:
+            buffers_map.close()
+        except BufferError:
+            pass
+
+class SQLiteCache:
+    """A persistent dict-like mapping of strings to picklable values, backed by SQLite."""
+    def __init__(self, db_file: Path):
+        """
+        A persistent dict-like mapping of strings to picklable values, backed by SQLite.
+
+        Parameters
+        ----------
+        db_file : Path
+            Path to the SQLite database file, which is created if it does not exist.
+
+        Notes
+        -----
+        Each entry is written as it is set, so only new entries are serialised and a crash loses
+        at most the uncommitted entries. Call `commit()` to make new entries durable.
+        """
+        self.db_file = db_file
+        self.connection = sqlite3.connect(str(db_file), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cache "
+                                "(key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+
+    def __contains__(self, key: str) -> bool:
+        return self.connection.execute("SELECT 1 FROM cache WHERE key = ?",
+                                       (key,)).fetchone() is not None
+
+    def __getitem__(self, key: str) -> Any:
+        row = self.connection.execute("SELECT value FROM cache WHERE key = ?",
+                                      (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0])
+
+    def __setitem__(self, key: str, value: Any):
+        self.connection.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value for `key` if it is in the cache, else `default`."""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Return a dict of the entries for those of `keys` which are in the cache."""
+        entries = {}
+        for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            chunk = keys[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({placeholders})", chunk
+            )
+            entries.update((key, pickle.loads(value)) for key, value in rows)
+        return entries
+
+    def update(self, entries: Dict[str, Any]):
+        """Add several entries to the cache."""
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+            ((key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+             for key, value in entries.items())
+        )
+
+    def commit(self):
+        """Commit any new entries to disk."""
+        self.connection.commit()
+
+    def close(self):
+        """Commit any new entries and close the database connection."""
+        self.connection.commit()
+        self.connection.close()
+
 class CacheManager:
     """Cache Python variables to files using Pickle."""
     def __init__(self, cache_dir: Optional[Path] = None):
@@ -34,11 +152,28 @@ class CacheManager:
         if not self.cache_dir.is_dir():
             raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), self.cache_dir)
         self.version_string = __version__.replace(".", "-")
+        self._filenames = {}
 
-    def _get_filename(self, label):
+    def _get_filename(self, label, extension="p"):
         """Generate a filename using `label` and the current version string."""
-        file_name = f"{label}_{self.version_string}.p"
-        return self.cache_dir.joinpath(file_name)
+        try:
+            return self._filenames[(label, extension)]
+        except KeyError:
+            file_name = f"{label}_{self.version_string}.{extension}"
+            cache_file = self._filenames[(label, extension)] = self.cache_dir.joinpath(file_name)
+            return cache_file
+
+    def _get_buffers_filename(self, label: str, generation: str) -> Path:
+        """Generate the filename of the `.buffers` sidecar written alongside `label`'s pickle."""
+        return self.cache_dir.joinpath(f"{label}_{self.version_string}.{generation}.buffers")
+
+    @staticmethod
+    def _get_tmp_filename(cache_file: Path) -> Path:
+        """
+        Generate a unique temporary filename alongside `cache_file`, to be written and then moved
+        into place with `os.replace`, so that concurrent writers never share a temporary file.
+        """
+        return cache_file.with_name(f"{cache_file.name}.{uuid.uuid4().hex}.tmp")
 
     def retrieve(self, label: str) -> Any:
         """
@@ -54,12 +189,74 @@ class CacheManager:
         Any or None
             The Python variable that was stored in the cache file with `label`. Returns None if the
             cache was not found.
+
+        Notes
+        -----
+        Cache contents are memoised within the process (keyed by the file's modification time),
+        so repeated Geocoder instances share the already-unpickled data rather than reading the
+        file again. The returned object is therefore shared with every other caller that
+        retrieves the same label and must be treated as read-only - copy it before making any
+        modifications. Memoised contents are released by `release()` (called when a Geocoder
+        context manager exits) and by `clear()`. Set the environment variable
+        `GEOCODE_DISABLE_LOOKUP_CACHE` to disable memoisation.
+        """
+        cache_file = self._get_filename(label, extension="p.zst")
+        if not ZSTD_AVAILABLE or not cache_file.is_file():
+            cache_file = self._get_filename(label)
+        if not cache_file.is_file():
+            return None
+        mtime = cache_file.stat().st_mtime_ns
+        use_lookup_cache = not os.environ.get("GEOCODE_DISABLE_LOOKUP_CACHE")
+        if use_lookup_cache:
+            cached = _LOOKUP_CACHE.get(cache_file)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            _evict(cache_file)
+        with open(cache_file, "rb", buffering=IO_BUFFER_SIZE) as pickle_fid:
+            if cache_file.suffix == ".zst":
+                with zstandard.ZstdDecompressor().stream_reader(pickle_fid) as zstd_fid:
+                    buffers_map, data = self._load_pickle(label, zstd_fid)
+            else:
+                buffers_map, data = self._load_pickle(label, pickle_fid)
+        if data is None:
+            return None
+        if use_lookup_cache:
+            _LOOKUP_CACHE[cache_file] = (mtime, data, buffers_map)
+        return data
+
+    def _load_pickle(self, label: str, pickle_fid: Any) -> Tuple[Optional[mmap.mmap], Any]:
+        """
+        Unpickle a cache file written by `write`, returning the memory-mapped buffers file (if
+        any) and the data. The data is preceded by a header naming the generation of the
+        `.buffers` sidecar holding its out-of-band buffers, so a pickle is never paired with a
+        sidecar written for different data. Returns (None, None) if the sidecar is missing or the
+        file cannot otherwise be unpickled, which callers treat as a cache miss.
         """
-        cache_file = self._get_filename(label)
-        if cache_file.is_file():
-            with open(cache_file, "rb") as pickle_fid:
-                return pickle.load(pickle_fid)
-        return None
+        try:
+            header = pickle.load(pickle_fid)
+            if not (isinstance(header, tuple) and len(header) == 2 and
+                    header[0] == PICKLE_HEADER):
+                return None, header
+            generation = header[1]
+            if generation is None:
+                return None, pickle.load(pickle_fid)
+            buffers_map, buffers = self._read_buffers(self._get_buffers_filename(label,
+                                                                                 generation))
+            if buffers_map is None:
+                logging.debug("Buffers file for cache '%s' is missing, ignoring cache", label)
+                return None, None
+            return buffers_map, pickle.load(pickle_fid, buffers=buffers)
+        except pickle.UnpicklingError:
+            logging.debug("Unable to unpickle cache '%s', ignoring cache", label)
+            return None, None
+
+    def release(self) -> None:
+        """
+        Release any cache contents memoised by `retrieve` from this cache directory, so that they
+        can be garbage collected once no longer referenced elsewhere.
+        """
+        for cache_file in [f for f in _LOOKUP_CACHE if f.parent == self.cache_dir]:
+            _evict(cache_file)
 
     def write(self, label: str, data: Any):
         """
@@ -72,10 +269,332 @@ class CacheManager:
         data : Any
             Data to cache - must be a data type that can be pickled, see
             https://docs.python.org/3/library/pickle.html#what-can-be-pickled-and-unpickled
+
+        Notes
+        -----
+        Uses pickle protocol 5, with large contiguous buffers (e.g. the Numpy arrays backing a
+        DataFrame) written out-of-band to a `.buffers` sidecar file which is memory-mapped by
+        `retrieve`, rather than being copied through the pickle stream. If zstandard is
+        installed, the (in-band) pickle stream is compressed and written to a `.p.zst` file.
+        Each write uses a new sidecar file, named with a unique generation which is recorded in
+        the pickle, so that readers never pair the pickle with another write's buffers.
+        """
+        cache_file = self._get_filename(label, extension="p.zst" if ZSTD_AVAILABLE else "p")
+        stale_file = self._get_filename(label, extension="p" if ZSTD_AVAILABLE else "p.zst")
+        _evict(cache_file)
+        _evict(stale_file)
+        buffers = []
+        protocol = max(5, pickle.HIGHEST_PROTOCOL)
+        pickled = pickle.dumps(data, protocol=protocol, buffer_callback=buffers.append)
+        generation = uuid.uuid4().hex if buffers else None
+        pickled = pickle.dumps((PICKLE_HEADER, generation), protocol=protocol) + pickled
+        if ZSTD_AVAILABLE:
+            pickled = zstandard.ZstdCompressor(level=3).compress(pickled)
+        if buffers:
+            buffers_file = self._get_buffers_filename(label, generation)
+            self._write_buffers(buffers_file, buffers)
+        else:
+            buffers_file = None
+        if stale_file.is_file():
+            stale_file.unlink()
+        tmp_file = self._get_tmp_filename(cache_file)
+        with open(tmp_file, "wb") as pickle_fid:
+            pickle_fid.write(pickled)
+        os.replace(tmp_file, cache_file)
+        for old_buffers_file in self.cache_dir.glob(f"{label}_{self.version_string}.*buffers"):
+            if old_buffers_file != buffers_file:
+                try:
+                    old_buffers_file.unlink()
+                except OSError:
+                    # Still mapped by a reader (on Windows) or already removed by another writer
+                    pass
+
+    @staticmethod
+    def _write_buffers(buffers_file: Path, buffers: List[pickle.PickleBuffer]) -> None:
+        """
+        Write pickle protocol 5 out-of-band buffers to a sidecar file. Each buffer is written as an
+        8-byte little-endian length followed by the raw bytes, padded so that every buffer starts
+        on a 64-byte boundary.
+        """
+        tmp_file = CacheManager._get_tmp_filename(buffers_file)
+        with open(tmp_file, "wb", buffering=IO_BUFFER_SIZE) as buffers_fid:
+            for buffer in buffers:
+                raw = buffer.raw()
+                buffers_fid.write(struct.pack("<Q", raw.nbytes))
+                buffers_fid.write(b"\0" * (-buffers_fid.tell() % BUFFER_ALIGNMENT))
+                buffers_fid.write(raw)
+                buffers_fid.write(b"\0" * (-buffers_fid.tell() % BUFFER_ALIGNMENT))
+        os.replace(tmp_file, buffers_file)
+
+    @staticmethod
+    def _read_buffers(buffers_file: Path) -> Tuple[Optional[mmap.mmap],
+                                                   Optional[List[memoryview]]]:
+        """
+        Memory-map a sidecar file written by `_write_buffers` and return the map and a view onto
+        each buffer. The mapping is copy-on-write so that the unpickled arrays remain writeable.
+        """
+        if not buffers_file.is_file():
+            return None, None
+        with open(buffers_file, "rb") as buffers_fid:
+            buffers_map = mmap.mmap(buffers_fid.fileno(), 0, access=mmap.ACCESS_COPY)
+        view = memoryview(buffers_map)
+        buffers = []
+        offset = 0
+        while offset < len(view):
+            nbytes, = struct.unpack_from("<Q", view, offset)
+            offset += 8
+            offset += -offset % BUFFER_ALIGNMENT
+            buffers.append(view[offset:offset + nbytes])
+            offset += nbytes
+            offset += -offset % BUFFER_ALIGNMENT
+        view.release()
+        return buffers_map, buffers
+
+    def retrieve_arrow(self, label: str) -> Optional["pd.DataFrame"]:
+        """
+        Retrieve a Pandas DataFrame from a Feather (Arrow IPC) cache file, memory-mapped.
+
+        Parameters
+        ----------
+        label : str
+            Provide a unique label to use when identifying the data.
+
+        Returns
+        -------
+        Pandas.DataFrame or None
+            The DataFrame that was stored in the cache file with `label`. Returns None if the cache
+            was not found.
+
+        Notes
+        -----
+        The columns are not consolidated into blocks, so numeric columns without nulls are views
+        onto the memory-mapped file: the pages are shared between all processes that load the same
+        cache file rather than being copied into each process. Falls back to `retrieve` (i.e.
+        Pickle) if PyArrow is not installed.
         """
-        cache_file = self._get_filename(label)
-        with open(cache_file, "wb") as pickle_fid:
-            pickle.dump(data, pickle_fid)
+        if not PYARROW_AVAILABLE:
+            return self.retrieve(label)
+        cache_file = self._get_filename(label, extension="feather")
+        if not cache_file.is_file():
+            return None
+        with pa.memory_map(str(cache_file), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.to_pandas(split_blocks=True)
+
+    def write_arrow(self, label: str, data: "pd.DataFrame"):
+        """
+        Write a Pandas DataFrame to a Feather (Arrow IPC) cache file.
+
+        Parameters
+        ----------
+        label : str
+            Provide a unique label to use when identifying the data.
+        data : Pandas.DataFrame
+            DataFrame to cache - columns must be types supported by Arrow.
+
+        Notes
+        -----
+        The file is written uncompressed so that it can be memory-mapped by `retrieve_arrow`. Falls
+        back to `write` (i.e. Pickle) if PyArrow is not installed.
+        """
+        if not PYARROW_AVAILABLE:
+            self.write(label, data)
+            return
+        cache_file = self._get_filename(label, extension="feather")
+        tmp_file = self._get_tmp_filename(cache_file)
+        feather.write_feather(data.reset_index(drop=True), tmp_file, compression="uncompressed")
+        os.replace(tmp_file, cache_file)
+
+    def retrieve_geoparquet(self, label: str) -> Optional["gpd.GeoDataFrame"]:
+        """
+        Retrieve a Geopandas GeoDataFrame from a GeoParquet cache file.
+
+        Parameters
+        ----------
+        label : str
+            Provide a unique label to use when identifying the data.
+
+        Returns
+        -------
+        Geopandas.GeoDataFrame or None
+            The GeoDataFrame that was stored in the cache file with `label`. Returns None if the
+            cache was not found.
+
+        Notes
+        -----
+        Falls back to `retrieve` (i.e. Pickle) if PyArrow is not installed or if there is no
+        GeoParquet file for `label`, so that existing pickled caches are still used.
+        """
+        cache_file = self._get_filename(label, extension="parquet")
+        if not PYARROW_AVAILABLE or not cache_file.is_file():
+            return self.retrieve(label)
+        import geopandas as gpd
+        return gpd.read_parquet(cache_file)
+
+    def write_geoparquet(self, label: str, data: "gpd.GeoDataFrame"):
+        """
+        Write a Geopandas GeoDataFrame to a GeoParquet cache file, with geometries stored as WKB.
+
+        Parameters
+        ----------
+        label : str
+            Provide a unique label to use when identifying the data.
+        data : Geopandas.GeoDataFrame
+            GeoDataFrame to cache.
+
+        Notes
+        -----
+        Falls back to `write` (i.e. Pickle) if PyArrow is not installed.
+        """
+        if not PYARROW_AVAILABLE:
+            self.write(label, data)
+            return
+        cache_file = self._get_filename(label, extension="parquet")
+        tmp_file = self._get_tmp_filename(cache_file)
+        data.to_parquet(tmp_file)
+        os.replace(tmp_file, cache_file)
+
+    def open_sqlite(self, label: str,
+                    migrate_key: Optional[Callable[[str], Iterable[str]]] = None) -> SQLiteCache:
+        """
+        Open (or create) a dict-like cache backed by an SQLite database.
+
+        Parameters
+        ----------
+        label : str
+            Provide a unique label to use when identifying the data.
+        migrate_key : callable
+            Optionally map each key of a legacy pickled cache to the key(s) it should be stored
+            under in the database, for when the format of the keys has changed.
+
+        Returns
+        -------
+        SQLiteCache
+            A persistent mapping whose entries are written to the database individually.
+
+        Notes
+        -----
+        If the database is empty and a pickled dict exists for `label` (i.e. written by `write`),
+        its entries are migrated into the database.
+        """
+        cache = SQLiteCache(self._get_filename(label, extension="sqlite"))
+        if len(cache) == 0:
+            legacy_cache = self.retrieve(label)
+            if legacy_cache:
+                logging.debug("Migrating %s entries from '%s' cache to SQLite", len(legacy_cache),
+                              label)
+                if migrate_key is not None:
+                    migrated = {}
+                    for key, value in legacy_cache.items():
+                        for new_key in migrate_key(key):
+                            migrated.setdefault(new_key, value)
+                    legacy_cache = migrated
+                cache.update(legacy_cache)
+                cache.commit()
+        return cache
+
+    def retrieve_regions(self, label: str) -> Optional[Dict]:
+        """
+        Retrieve a dict of region boundaries written by `write_regions`.
+
+        Parameters
+        ----------
+        label : str
+            Provide a unique label to use when identifying the data.
+
+        Returns
+        -------
+        dict
+            Dict whose keys are the region IDs and whose values are a tuple containing:
+            (region_boundary, region_bounds), or None if the cache file could not be found.
+        """
+        contents = self.retrieve(label)
+        if contents is None:
+            return None
+        if "wkb" not in contents:
+            # Pickled by an older release as a plain dict of regions - convert it once
+            logging.debug("Converting legacy region boundaries cache ('%s')", label)
+            self.write_regions(label, contents)
+            return contents
+        import shapely
+        wkb = contents["wkb"].tobytes()
+        offsets = contents["offsets"].tolist()
+        geometries = shapely.from_wkb([wkb[start:end] for start, end in zip(offsets[:-1],
+                                                                            offsets[1:])])
+        return dict(zip(contents["region_ids"],
+                        zip(geometries.tolist(), map(tuple, contents["bounds"].tolist()))))
+
+    def write_regions(self, label: str, regions: Dict):
+        """
+        Write a dict of region boundaries to the cache.
+
+        Parameters
+        ----------
+        label : str
+            Provide a unique label to use when identifying the data.
+        regions : dict
+            Dict whose keys are the region IDs and whose values are a tuple containing:
+            (region_boundary, region_bounds), as used by `utilities.reverse_geocode()`.
+
+        Notes
+        -----
+        Rather than pickling each Shapely geometry individually, the boundaries are encoded as WKB
+        into one contiguous byte array (plus offsets) and the bounds into one float array, which
+        are pickled out-of-band and decoded in a single vectorised `shapely.from_wkb` call.
+        """
+        import shapely
+        region_ids = list(regions)
+        geometries = np.empty(len(region_ids), dtype=object)
+        geometries[:] = [regions[r][0] for r in region_ids]
+        wkb = shapely.to_wkb(geometries).tolist()
+        offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+        np.cumsum([len(w) for w in wkb], out=offsets[1:])
+        contents = {
+            "region_ids": region_ids,
+            "wkb": np.frombuffer(b"".join(wkb), dtype=np.uint8),
+            "offsets": offsets,
+            "bounds": np.array([regions[r][1] for r in region_ids],
+                               dtype=np.float64).reshape(-1, 4),
+        }
+        self.write(label, contents)
+
+    def retrieve_array(self, label: str) -> Optional[np.ndarray]:
+        """
+        Retrieve a Numpy array from a cache file, memory-mapped read-only.
+
+        Parameters
+        ----------
+        label : str
+            Provide a unique label to use when identifying the data.
+
+        Returns
+        -------
+        Numpy.memmap or None
+            The array that was stored in the cache file with `label`. Returns None if the cache was
+            not found.
+        """
+        cache_file = self._get_filename(label, extension="npy")
+        if not cache_file.is_file():
+            return None
+        return np.load(cache_file, mmap_mode="r", allow_pickle=False)
+
+    def write_array(self, label: str, data: np.ndarray):
+        """
+        Write a Numpy array to a cache file in `.npy` format so that it can be memory-mapped.
+
+        Parameters
+        ----------
+        label : str
+            Provide a unique label to use when identifying the data.
+        data : Numpy.ndarray
+            Array to cache - must not contain Python objects.
+        """
+        cache_file = self._get_filename(label, extension="npy")
+        # Write to a temporary file first since the cache file may already be memory-mapped
+        tmp_file = self._get_tmp_filename(cache_file)
+        with open(tmp_file, "wb") as npy_fid:
+            np.save(npy_fid, data, allow_pickle=False)
+        os.replace(tmp_file, cache_file)
 
     def clear(self,
               delete_gmaps_cache: bool = False,
@@ -91,21 +610,46 @@ class CacheManager:
         old_versions_only : boolean
             Optional boolean deciding whether or not to clear all cache files or just those
             corresponding to previous versions of the Geocode library. Defaults to False.
+
+        Notes
+        -----
+        The cache generation (i.e. the version string) is recorded in a `GENERATION` file in the
+        cache directory once old versions have been cleared, along with whether old GMaps caches
+        were cleared too, so that subsequent calls with `old_versions_only=True` return without
+        scanning the directory until the version changes.
         """
+        generation_file = self.cache_dir.joinpath(GENERATION_FILE)
+        if old_versions_only:
+            try:
+                generation = generation_file.read_text().split()
+            except FileNotFoundError:
+                generation = []
+            if generation[:1] == [self.version_string] and \
+                    (not delete_gmaps_cache or "gmaps" in generation[1:]):
+                return
         logging.debug("Deleting cache files (delete_gmaps_cache=%s, old_versions_only=%s)",
                       delete_gmaps_cache, old_versions_only)
-        cache_files = self.cache_dir.glob("*.p")
-        for cache_file in cache_files:
-            if not delete_gmaps_cache and "gmaps" in cache_file.name:
-                continue
-            if old_versions_only:
-                if self.version_string in cache_file.name:
+        self.release()
+        cache_extensions = (".p", ".p.zst", ".buffers", ".feather", ".parquet", ".npy", ".sqlite",
+                            ".sqlite-wal", ".sqlite-shm")
+        keep_gmaps_cache = not delete_gmaps_cache
+        version_string = self.version_string
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if not name.endswith(cache_extensions):
                     continue
-            try:
-                cache_file.unlink()
-            except FileNotFoundError:
-                pass
-            except:
-                raise Exception("Error deleting cache file: ", cache_file)
-            logging.debug("Deleted '%s'", cache_file)
-
+                if keep_gmaps_cache and "gmaps" in name:
+                    continue
+                if old_versions_only and version_string in name:
+                    continue
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+                except:
+                    raise Exception("Error deleting cache file: ", entry.path)
+                logging.debug("Deleted '%s'", entry.path)
+        if old_versions_only:
+            generation_file.write_text(f"{self.version_string}\ngmaps" if delete_gmaps_cache
+                                       else self.version_string)
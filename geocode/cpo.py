@@ -7,19 +7,29 @@ Manage data from Ordnance Survey's Code Point Open dataset.
 """
 
 import os
-import sys
-import pickle
 import zipfile
 import logging
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Iterable, Tuple, Union, List, Dict
 
 import pandas as pd
 import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
-from . utilities import GenericException, bng2latlon
+from . utilities import GenericException, bng2latlon, normalise_postcode
 
 SCRIPT_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
+# The postcode lookup stores latitudes and longitudes as int32 multiples of 1e-7 degrees (~1cm)
+LOOKUP_COORD_SCALE = 1e7
+LOOKUP_DTYPE = np.dtype([("postcode", "S8"), ("latitude", "i4"), ("longitude", "i4")])
 
 class CodePointOpen:
     """The Code Point Open data manager for the Geocode class."""
@@ -28,7 +38,11 @@ class CodePointOpen:
         self.cache_manager = cache_manager
         self.cpo_zipfile = SCRIPT_DIR.joinpath("code_point_open", "codepo_gb.zip")
         self.cpo = None
+        self.lookup = None
+        self.prefixes = None
         self.cache = None
+        # Serialises extraction so that concurrent loaders don't extract Code Point Open twice
+        self._load_lock = threading.RLock()
 
     def force_setup(self):
         """
@@ -38,46 +52,112 @@ class CodePointOpen:
 
     def _load(self, force_reload : bool = False):
         """Load the OS Code Point Open Database, either from raw zip file or local cache."""
-        if self.cpo is not None and not force_reload:
+        with self._load_lock:
+            if self.cpo is not None and not force_reload:
+                return
+            cpo_cache_name = "code_point_open"
+            cpo_cache_contents = self.cache_manager.retrieve_arrow(cpo_cache_name)
+            if cpo_cache_contents is not None and not force_reload:
+                logging.debug("Loading Code Point Open data from cache ('%s')", cpo_cache_name)
+                self.cpo = cpo_cache_contents
+                return
+            logging.info("Extracting the Code Point Open data (this only needs to be done once)")
+            if not zipfile.is_zipfile(self.cpo_zipfile):
+                raise GenericException("Could not find the OS Code Point Open data: "
+                                       f"'{self.cpo_zipfile}'")
+            with zipfile.ZipFile(self.cpo_zipfile, "r") as cpo_zip:
+                cpo_files = [f for f in cpo_zip.namelist()
+                             if "Data/CSV/" in f and not f.endswith("/")]
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                cpo_parts = list(executor.map(self._read_cpo_csv, cpo_files))
+            if PYARROW_AVAILABLE:
+                cpo = pa.concat_tables(cpo_parts)
+                postcodes = pc.utf8_upper(pc.replace_substring(cpo["Postcode"], " ", ""))
+                cpo = cpo.set_column(cpo.schema.get_field_index("Postcode"), "Postcode", postcodes)
+                cpo = cpo.append_column("outward_postcode",
+                                        pc.utf8_slice_codeunits(postcodes, 0, -3))
+                cpo = cpo.append_column("inward_postcode",
+                                        pc.utf8_slice_codeunits(postcodes, -3, 2147483647))
+                cpo = cpo.to_pandas()
+            else:
+                cpo = pd.concat(cpo_parts, ignore_index=True)
+                postcodes = [p.replace(" ", "").upper() for p in cpo["Postcode"].tolist()]
+                cpo["Postcode"] = postcodes
+                cpo["outward_postcode"] = [p[:-3] for p in postcodes]
+                cpo["inward_postcode"] = [p[-3:] for p in postcodes]
+            cpo["outward_postcode"] = cpo["outward_postcode"].astype("category")
+            cpo["inward_postcode"] = cpo["inward_postcode"].astype("category")
+            eastings = cpo["Eastings"].to_numpy(dtype=np.float64)
+            northings = cpo["Northings"].to_numpy(dtype=np.float64)
+            nn_indices = ~np.isnan(eastings) & (cpo["Positional_quality_indicator"].to_numpy() < 90)
+            longitudes = np.full(cpo.shape[0], np.nan)
+            latitudes = np.full(cpo.shape[0], np.nan)
+            longitudes[nn_indices], latitudes[nn_indices] = bng2latlon(eastings[nn_indices],
+                                                                       northings[nn_indices])
+            cpo["longitude"] = longitudes
+            cpo["latitude"] = latitudes
+            self.cache_manager.write_arrow(cpo_cache_name, cpo)
+            logging.info("Code Point Open extracted and written to cache")
+            self.cpo = cpo
+            self.lookup = self._write_lookup(cpo)
+            self.prefixes = self._write_prefixes(cpo)
             return
-        cpo_cache_name = "code_point_open"
-        cpo_cache_contents = self.cache_manager.retrieve(cpo_cache_name)
-        if cpo_cache_contents is not None and not force_reload:
-            logging.debug("Loading Code Point Open data from cache ('%s')", cpo_cache_name)
-            self.cpo = cpo_cache_contents
-            return
-        logging.info("Extracting the Code Point Open data (this only needs to be done once)")
-        if not zipfile.is_zipfile(self.cpo_zipfile):
-            raise GenericException("Could not find the OS Code Point Open data: "
-                                   f"'{self.cpo_zipfile}'")
+
+    def _read_cpo_csv(self, cpo_file: str) -> Union[pd.DataFrame, "pa.Table"]:
+        """
+        Read one of the CSV files from the Code Point Open zip file, as a PyArrow Table if PyArrow
+        is available else as a Pandas DataFrame. The zip file is opened separately for each CSV so
+        that several can be read concurrently.
+        """
         columns = ["Postcode", "Positional_quality_indicator", "Eastings", "Northings",
                    "Country_code", "NHS_regional_HA_code", "NHS_HA_code", "Admin_county_code",
                    "Admin_district_code", "Admin_ward_code"]
-        dtypes = {"Postcode": str, "Eastings": int, "Northings": int,
-                  "Positional_quality_indicator": int}
-        cpo = None
+        dtypes = {"Postcode": str, "Eastings": np.int32, "Northings": np.int32,
+                  "Positional_quality_indicator": np.int8}
         with zipfile.ZipFile(self.cpo_zipfile, "r") as cpo_zip:
-            for cpo_file in cpo_zip.namelist():
-                if "Data/CSV/" not in cpo_file:
-                    continue
-                with cpo_zip.open(cpo_file) as cpo_file_part:
-                    data = pd.read_csv(cpo_file_part, names=columns, dtype=dtypes,
-                                       usecols=["Postcode", "Positional_quality_indicator",
-                                                "Eastings", "Northings"])
-                    cpo = pd.concat([cpo, data]) if cpo is not None else data
-        cpo["Postcode"] = cpo["Postcode"].str.replace(" ", "", regex=False)
-        cpo["Postcode"] = cpo["Postcode"].str.upper()
-        nn_indices = cpo["Eastings"].notnull() & cpo["Positional_quality_indicator"] < 90
-        lons, lats = bng2latlon(cpo.loc[nn_indices, ("Eastings")].to_numpy(),
-                                cpo.loc[nn_indices, ("Northings")].to_numpy())
-        cpo.loc[nn_indices, "longitude"] = lons
-        cpo.loc[nn_indices, "latitude"] = lats
-        cpo["outward_postcode"] = cpo["Postcode"].str.slice(0, -3).str.strip()
-        cpo["inward_postcode"] = cpo["Postcode"].str.slice(-3).str.strip()
-        self.cache_manager.write(cpo_cache_name, cpo)
-        logging.info("Code Point Open extracted and pickled to cache")
-        self.cpo = cpo
-        return
+            if PYARROW_AVAILABLE:
+                # Decompress the whole member up front so that PyArrow parses an in-memory buffer
+                # rather than calling back into Python (holding the GIL) for each block it reads
+                cpo_file_part = pa.BufferReader(cpo_zip.read(cpo_file))
+                arrow_types = {"Postcode": pa.string(), "Eastings": pa.int32(),
+                               "Northings": pa.int32(), "Positional_quality_indicator": pa.int8()}
+                return pacsv.read_csv(
+                    cpo_file_part,
+                    read_options=pacsv.ReadOptions(column_names=columns),
+                    convert_options=pacsv.ConvertOptions(
+                        column_types=arrow_types,
+                        include_columns=["Postcode", "Positional_quality_indicator",
+                                         "Eastings", "Northings"]
+                    )
+                )
+            with cpo_zip.open(cpo_file) as cpo_file_part:
+                return pd.read_csv(cpo_file_part, names=columns, dtype=dtypes,
+                                   usecols=["Postcode", "Positional_quality_indicator",
+                                            "Eastings", "Northings"], engine="c")
+
+    def _write_lookup(self, cpo: pd.DataFrame) -> np.ndarray:
+        """
+        Write a postcode lookup to the cache as a Numpy structured array sorted by postcode, so that
+        full postcodes can be geocoded without loading the whole Code Point Open Database. The
+        coordinates are stored as fixed-point integers (see `LOOKUP_COORD_SCALE`), which keeps each
+        row to 16 bytes.
+        """
+        located = cpo[cpo["latitude"].notnull()].sort_values("Postcode")
+        lookup = np.empty(located.shape[0], dtype=LOOKUP_DTYPE)
+        lookup["postcode"] = located["Postcode"].str.encode("utf-8").to_numpy()
+        lookup["latitude"] = np.round(located["latitude"].to_numpy() * LOOKUP_COORD_SCALE)
+        lookup["longitude"] = np.round(located["longitude"].to_numpy() * LOOKUP_COORD_SCALE)
+        self.cache_manager.write_array("code_point_open_lookup", lookup)
+        return self.cache_manager.retrieve_array("code_point_open_lookup")
+
+    def _load_lookup(self) -> np.ndarray:
+        """Load (memory-map) the sorted postcode lookup, creating it if necessary."""
+        with self._load_lock:
+            lookup = self.cache_manager.retrieve_array("code_point_open_lookup")
+            if lookup is None or lookup.dtype != LOOKUP_DTYPE:
+                self._load()
+                lookup = self.lookup if self.lookup is not None else self._write_lookup(self.cpo)
+        return lookup
     
     def geocode_postcode(self,
                          postcodes: Iterable[str]) -> List[Tuple[float, float, int]]:
@@ -101,43 +181,54 @@ class CodePointOpen:
         -----
         The input iterables can be any Python object which can be interpreted by Pandas.DataFrame()
         e.g. a list, tuple, Numpy array etc.
+        Full postcodes are looked up in a sorted array of all postcodes, and partial postcodes in a
+        table of mean locations keyed by partial postcode. Both are precomputed when Code Point
+        Open is extracted and are cached separately, so the full Code Point Open DataFrame is not
+        loaded or scanned here.
         """
         if self.cache is None:
             self._load_cache()
-        results = []
         logging.debug("Geocoding %s postcodes using Code Point Open", len(postcodes))
-        inputs = pd.DataFrame({"input_postcode": postcodes})
-        inputs["id"] = np.arange(inputs.shape[0])
-        results = inputs.merge(self.cache, how="left", on=["input_postcode"])
-        results_cols = ["latitude", "longitude", "match_status"]
-        if not results.latitude.isnull().any():
-            return results[results_cols].to_records(index=False)
-        new_postcodes = results.latitude.isnull()
-        inputs_ = inputs.loc[new_postcodes, ["input_postcode", "id"]]
-        inputs_["postcode_to_match"] = inputs_.input_postcode.str.strip().str.upper().str.replace(" ", "")
-        self._load()
-        results_ = inputs_.merge(self.cpo[["Postcode", "latitude", "longitude"]], how="left",
-                                 left_on="postcode_to_match", right_on="Postcode")
-        results_ = results_.groupby("id").agg(input_postcode=("input_postcode", "first"),
-                                              postcode_to_match=("postcode_to_match", "first"),
-                                              postcode_matched=("Postcode", "first"),
-                                              latitude=("latitude", np.nanmean),
-                                              longitude=("longitude", np.nanmean)).reset_index()
-        success = results_.postcode_matched.notnull()
-        results_.loc[success, "match_status"] = 1
-        results = pd.concat((results.loc[~new_postcodes], results_))
-        if results.latitude.isnull().any():
-            cpo_geocode_one = lambda p: self.geocode_one(p.input_postcode)
-            results.loc[~success, ["latitude", "longitude", "match_status"]] = \
-                results.loc[~success].apply(cpo_geocode_one, axis=1)
-        results["match_status"] = results.match_status.astype(int)
-        logging.debug("Adding postcodes to lookup")
-        cache = pd.concat([self.cache, 
-                           results[results.latitude.notnull()].drop(columns="id")],
-                           ignore_index=True)
-        self.cache = cache.drop_duplicates(subset=["input_postcode"], 
-                                           keep="last", ignore_index=True)
-        return results.sort_values("id")[results_cols].to_records(index=False)
+        inverse, postcodes = pd.factorize(pd.Series(list(postcodes), dtype=object),
+                                          use_na_sentinel=False)
+        # Normalise each distinct input once, then merge inputs which normalise to the same key
+        normalised_inverse, postcodes = pd.factorize(
+            pd.Series([normalise_postcode(p) for p in postcodes], dtype=object),
+            use_na_sentinel=False
+        )
+        inverse = normalised_inverse[inverse]
+        postcodes = list(postcodes)
+        lats = np.full(len(postcodes), np.nan)
+        lons = np.full(len(postcodes), np.nan)
+        status = np.zeros(len(postcodes), dtype=int)
+        todo = []
+        for i, postcode in enumerate(postcodes):
+            cached = self.cache.get(postcode)
+            if cached is None:
+                todo.append(i)
+            else:
+                lats[i], lons[i], status[i] = cached
+        if todo:
+            if self.lookup is None:
+                self.lookup = self._load_lookup()
+            keys = np.array([postcodes[i].replace(" ", "").encode("utf-8")
+                             if isinstance(postcodes[i], str) else b"" for i in todo], dtype="S8")
+            idx = np.minimum(np.searchsorted(self.lookup["postcode"], keys),
+                             self.lookup.shape[0] - 1)
+            found = self.lookup["postcode"][idx] == keys
+            todo = np.array(todo)
+            lats[todo[found]] = self.lookup["latitude"][idx[found]] / LOOKUP_COORD_SCALE
+            lons[todo[found]] = self.lookup["longitude"][idx[found]] / LOOKUP_COORD_SCALE
+            status[todo[found]] = 1
+            missing = todo[~found]
+            if missing.size:
+                lats[missing], lons[missing], status[missing] = \
+                    self._geocode_partials([postcodes[i] for i in missing])
+            logging.debug("Adding postcodes to lookup")
+            for i in todo[~np.isnan(lats[todo])]:
+                self.cache[postcodes[i]] = (lats[i], lons[i], status[i])
+        return np.rec.fromarrays([lats[inverse], lons[inverse], status[inverse]],
+                                 names=["latitude", "longitude", "match_status"])
 
     def geocode_one(self, postcode: str) -> pd.Series:
         """
@@ -156,29 +247,60 @@ class CodePointOpen:
             match_status (int). The status code shows the quality of the postcode lookup - use the
             class attribute *self.status_codes* (a dict) to get a string representation.
         """
-        self._load()
-        try:
-            postcode = postcode.upper()
-        except:
-            return pd.Series({"latitude": np.nan, "longitude": np.nan, "match_status": 0})
-        
-        if " " in postcode:
-            outward, inward = postcode.split(" ", 1)
-            myfilter = (self.cpo["outward_postcode"] == outward) & \
-                       (self.cpo["inward_postcode"].str.slice(0, len(inward)) == inward)
-        else:
-            outward = postcode
-            myfilter = self.cpo["outward_postcode"] == outward
-        match = self.cpo[myfilter].agg("mean", numeric_only=True)
-        if not np.isnan(match.latitude):
-            match["match_status"] = 2
-            return match[["latitude", "longitude", "match_status"]]
-        return pd.Series({"latitude": np.nan, "longitude": np.nan, "match_status": 0})
+        lats, lons, status = self._geocode_partials([postcode])
+        return pd.Series({"latitude": lats[0], "longitude": lons[0], "match_status": status[0]})
+
+    def _geocode_partials(self,
+                          postcodes: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Geocode partial postcodes using the mean location of all matching full postcodes, returning
+        arrays of latitudes, longitudes and status codes.
+        """
+        if self.prefixes is None:
+            self._load_prefixes()
+        keys = [normalise_postcode(postcode) if isinstance(postcode, str) else ""
+                for postcode in postcodes]
+        idx = self.prefixes.index.get_indexer(keys)
+        found = idx >= 0
+        lats = np.where(found, self.prefixes["latitude"].to_numpy()[idx], np.nan)
+        lons = np.where(found, self.prefixes["longitude"].to_numpy()[idx], np.nan)
+        return lats, lons, np.where(found, 2, 0)
+
+    def _write_prefixes(self, cpo: pd.DataFrame) -> pd.DataFrame:
+        """
+        Write a table of the mean latitude and longitude of the postcodes contained in each partial
+        postcode (i.e. the outward code, optionally followed by a space and the start of the inward
+        code) to the cache, so that partial postcodes can be geocoded without loading the whole
+        Code Point Open Database.
+        """
+        located = cpo[cpo["latitude"].notnull()]
+        prefixes = []
+        # Full postcodes (all three inward characters) are already in the postcode lookup
+        for inward_chars in range(3):
+            if inward_chars == 0:
+                keys = located["outward_postcode"]
+            else:
+                keys = located["outward_postcode"].astype(str) + " " + \
+                       located["inward_postcode"].astype(str).str.slice(0, inward_chars)
+            prefixes.append(located.groupby(keys.to_numpy())[["latitude", "longitude"]].mean())
+        prefixes = pd.concat(prefixes).rename_axis("prefix").reset_index()
+        self.cache_manager.write_arrow("code_point_open_prefixes", prefixes)
+        return prefixes.set_index("prefix")
+
+    def _load_prefixes(self):
+        """Load the table of partial postcode locations, creating it if necessary."""
+        with self._load_lock:
+            prefixes = self.cache_manager.retrieve_arrow("code_point_open_prefixes")
+            if prefixes is None:
+                self._load()
+                if self.prefixes is None:
+                    self.prefixes = self._write_prefixes(self.cpo)
+            else:
+                self.prefixes = prefixes.set_index("prefix")
 
     def _load_cache(self):
         """Load the cache of prior postcodes for better performance."""
         if self.cache is None:
-            self.cache = pd.DataFrame({"input_postcode": [], "input_address": [], "latitude": [],
-                                       "longitude": [], "match_status": []})
+            self.cache = {}
         return
     
\ No newline at end of file
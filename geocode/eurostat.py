@@ -12,6 +12,7 @@ import zipfile
 import json
 import csv
 import logging
+from collections import OrderedDict
 from pathlib import Path
 from typing import Optional, Iterable, Tuple, Union, List, Dict, Literal
 
@@ -22,6 +23,8 @@ import shapefile
 from . import utilities as utils
 
 SCRIPT_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
+# Maximum number of lat/lons whose NUTS_ID is remembered per NUTS year
+NUTS_CACHE_MAX_SIZE = 100000
 
 class Eurostat:
     """
@@ -36,6 +39,8 @@ class Eurostat:
         self.nuts_regions = {
             (l, y): None for y in [2003, 2006, 2010, 2013, 2016, 2021] for l in range(4)
         }
+        self.nuts_tree = {key: None for key in self.nuts_regions}
+        self.nuts_cache = {y: OrderedDict() for y in [2003, 2006, 2010, 2013, 2016, 2021]}
 
     def force_setup(self):
         """
@@ -67,7 +72,7 @@ class Eurostat:
             URBN_TYPE, COAST_TYPE, FID, id, geometry
         """
         cache_label = f"nuts_{year}_{level}"
-        nuts_boundaries_cache_contents = self.cache_manager.retrieve(cache_label)
+        nuts_boundaries_cache_contents = self.cache_manager.retrieve_geoparquet(cache_label)
         if nuts_boundaries_cache_contents is not None:
             logging.debug("Loading %s NUTS%s boundaries from cache ('%s')",
                           year, level, cache_label)
@@ -78,15 +83,15 @@ class Eurostat:
                         f"NUTS_RG_01M_{year}_4326_LEVL_{level}.geojson")
         success, api_response = utils.fetch_from_api(eurostat_url)
         if success:
-            raw = json.loads(api_response.text)
+            raw = utils.json_loads(api_response.content)
             nuts_regions = gpd.GeoDataFrame.from_features(raw["features"],
                                                           crs=raw["crs"]["properties"]["name"])
             nuts_regions.geometry = nuts_regions.buffer(0)
         else:
             raise utils.GenericException("Encountered an error while extracting %s NUTS%s region "
                                          "data from Eurostat API.")
-        self.cache_manager.write(cache_label, nuts_regions)
-        logging.info("%s NUTS%s boundaries extracted and pickled to file ('%s')",
+        self.cache_manager.write_geoparquet(cache_label, nuts_regions)
+        logging.info("%s NUTS%s boundaries extracted and written to file ('%s')",
                      year, level, cache_label)
         return nuts_regions
 
@@ -97,12 +102,16 @@ class Eurostat:
         Load the NUTS boundaries, either from local cache if available, else fetch from Eurostat
         API.
         """
+        cache_label = f"nuts_{year}_{level}_dict"
+        nuts_dict = self.cache_manager.retrieve(cache_label)
+        if nuts_dict is not None:
+            logging.debug("Loading %s NUTS%s regions from cache ('%s')", year, level, cache_label)
+            return nuts_dict
         nuts_gdf = self.load_nuts_boundaries(level, year)
-        nuts_gdf["bounds"] = nuts_gdf.bounds.apply(tuple, axis=1)
-        nuts_dict = nuts_gdf[["NUTS_ID", "geometry", "bounds"]].set_index("NUTS_ID")\
-                                                               .to_dict("index")
-        for r in nuts_dict:
-            nuts_dict[r] = tuple(nuts_dict[r].values())
+        bounds = map(tuple, nuts_gdf.geometry.bounds.to_numpy().tolist())
+        nuts_dict = dict(zip(nuts_gdf["NUTS_ID"].to_numpy(),
+                             zip(nuts_gdf.geometry.to_numpy(), bounds)))
+        self.cache_manager.write(cache_label, nuts_dict)
         return nuts_dict
 
     def reverse_geocode_nuts(self,
@@ -128,9 +137,37 @@ class Eurostat:
         list of strings
             The NUTS_ID codes that the input latitudes and longitudes fall within. Any lat/lons which
             do not fall inside a NUTS boundary will return None.
+
+        Notes
+        -----
+        NUTS regions are strictly hierarchical and a level `l` NUTS_ID is the first `2 + l`
+        characters of the IDs of the regions it contains. The finest NUTS_ID found for each
+        lat/lon is therefore remembered, so that later queries for the same lat/lon at the same or
+        a coarser level are answered without any geometry operations. At most
+        `NUTS_CACHE_MAX_SIZE` lat/lons are remembered per year, discarding the least recently used.
         """
-        if self.nuts_regions[(level, year)] is None:
-            self.nuts_regions[(level, year)] = self._load_nuts_boundaries(level=level, year=year)
-        results = utils.reverse_geocode(latlons, self.nuts_regions[(level, year)])
-        return results
+        code_length = 2 + level
+        cache = self.nuts_cache[year]
+        keys = [tuple(latlon) for latlon in latlons]
+        results = [cache.get(key) for key in keys]
+        for key, code in zip(keys, results):
+            if code is not None:
+                cache.move_to_end(key)
+        todo = [i for i, code in enumerate(results) if code is None or len(code) < code_length]
+        if todo:
+            if self.nuts_regions[(level, year)] is None:
+                self.nuts_regions[(level, year)] = self._load_nuts_boundaries(level=level,
+                                                                              year=year)
+            if self.nuts_tree[(level, year)] is None:
+                self.nuts_tree[(level, year)] = utils.build_strtree(self.nuts_regions[(level, year)])
+            new_results = utils.reverse_geocode_strtree([keys[i] for i in todo],
+                                                        *self.nuts_tree[(level, year)])
+            for i, code in zip(todo, new_results):
+                results[i] = code
+                if code is not None:
+                    cache[keys[i]] = code
+                    cache.move_to_end(keys[i])
+            while len(cache) > NUTS_CACHE_MAX_SIZE:
+                cache.popitem(last=False)
+        return [code[:code_length] if code is not None else None for code in results]
 
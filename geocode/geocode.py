@@ -15,11 +15,11 @@ from pathlib import Path
 import time as TIME
 import argparse
 from shutil import copyfile
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional, Iterable, Tuple, Union, List, Dict, Literal
 
-import pyproj
-
-from . utilities import GenericException
+from . utilities import GenericException, bng2latlon, latlon2bng
 from . cpo import CodePointOpen
 from . ngeso import NationalGrid
 from . ons_nrs import ONS_NRS
@@ -37,7 +37,8 @@ class Geocoder:
     """
     def __init__(self,
                  cache_dir: Optional[Path] = None,
-                 gmaps_key_file: Optional[Path] = None) -> None:
+                 gmaps_key_file: Optional[Path] = None,
+                 eager_load: bool = False) -> None:
         """
         Geocode addresses, postcodes, LLSOAs or Constituencies or reverse-geocode latitudes and
         longitudes.
@@ -48,7 +49,11 @@ class Geocoder:
             Optionally specify a directory to use for caching.
         `gmaps_key_file` : string
             Path to an API key file for Google Maps Geocode API.
+        `eager_load` : boolean
+            Set to True to load all datasets concurrently when entering the context manager, rather
+            than lazily the first time each one is needed. Defaults to False.
         """
+        self.eager_load = eager_load
         self.cache_manager = CacheManager(cache_dir)
         self.cache_manager.clear(delete_gmaps_cache=False, old_versions_only=True)
         self.cpo = CodePointOpen(self.cache_manager)
@@ -66,22 +71,49 @@ class Geocoder:
 
     def __enter__(self):
         """Context manager."""
+        if self.eager_load:
+            self._preload()
         return self
 
     def __exit__(self, type, value, traceback):
         """Context manager."""
-        self.gmaps.flush_cache()
+        self.gmaps.close_cache()
+        self.cache_manager.release()
+
+    def _preload(self):
+        """Load all datasets concurrently (loading is mostly I/O and unpickling)."""
+        loaders = [
+            (partial(setattr, self.ons_nrs, "llsoa_lookup"), self.ons_nrs._load_llsoa_lookup),
+            (partial(setattr, self.ons_nrs, "llsoa_regions"), self.ons_nrs._load_llsoa_boundaries),
+            (partial(setattr, self.ons_nrs, "dz_lookup"), self.ons_nrs._load_datazone_lookup),
+            (partial(setattr, self.ons_nrs, "constituency_lookup"),
+             self.ons_nrs._load_constituency_lookup),
+            (partial(setattr, self.ons_nrs, "lad_lookup"), self.ons_nrs._load_lad_lookup),
+            (partial(setattr, self.ons_nrs, "pc_llsoa_lookup"),
+             self.ons_nrs._load_postcode_llsoa_lookup),
+            (partial(setattr, self.ngeso, "gsp_regions"), self.ngeso._load_gsp_boundaries_20220314),
+            (partial(setattr, self.cpo, "lookup"), self.cpo._load_lookup),
+            (None, self.cpo._load_prefixes),
+        ]
+        loaders += [(partial(self.eurostat.nuts_regions.__setitem__, (level, 2021)),
+                     partial(self.eurostat._load_nuts_boundaries, level)) for level in range(4)]
+        logging.debug("Preloading %s datasets", len(loaders))
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+            futures = {executor.submit(loader): setter for setter, loader in loaders}
+            for future in as_completed(futures):
+                if futures[future] is not None:
+                    futures[future](future.result())
 
     def force_setup(self, ngeso_setup=True, cpo_setup=True, ons_setup=True, eurostat_setup=True):
-        """Download all data and setup caches."""
-        if ngeso_setup:
-            self.ngeso.force_setup()
-        if cpo_setup:
-            self.cpo.force_setup()
-        if ons_setup:
-            self.ons_nrs.force_setup()
-        if eurostat_setup:
-            self.eurostat.force_setup()
+        """Download all data and setup caches (the data managers are set up concurrently)."""
+        managers = [manager for manager, setup in [(self.ngeso, ngeso_setup),
+                                                   (self.cpo, cpo_setup),
+                                                   (self.ons_nrs, ons_setup),
+                                                   (self.eurostat, eurostat_setup)] if setup]
+        with ThreadPoolExecutor(max_workers=max(len(managers), 1)) as executor:
+            for future in as_completed([executor.submit(manager.force_setup)
+                                        for manager in managers]):
+                future.result()
 
     def get_dno_regions(self):
         """
@@ -284,9 +316,7 @@ class Geocoder:
         (lons, lats) as pyproj i.e. (x, y). Elsewhere in this module the convention is typically
         (lats, lons) due to personal preference.
         """
-        proj = pyproj.Transformer.from_crs(4326, 27700, always_xy=True)
-        eastings, northings = proj.transform(lons, lats)
-        return eastings, northings
+        return latlon2bng(lons, lats)
 
     @staticmethod
     def _bng2latlon(eastings: Iterable[Union[float, int]],
@@ -312,9 +342,7 @@ class Geocoder:
         (lons, lats) as pyproj i.e. (x, y). Elsewhere in this module the convention is typically
         (lats, lons) due to personal preference.
         """
-        proj = pyproj.Transformer.from_crs(27700, 4326, always_xy=True)
-        lons, lats = proj.transform(eastings, northings)
-        return lons, lats
+        return bng2latlon(eastings, northings)
 
 def parse_options():
     """Parse command line options."""
@@ -11,15 +11,16 @@ import sys
 import logging
 import pickle
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional, Iterable, Tuple, Union, List, Dict
 
 import numpy as np
 import pandas as pd
-import googlemaps
 
-from . utilities import GenericException
+from . utilities import GenericException, normalise_postcode
 
 SCRIPT_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
+GMAPS_MAX_WORKERS = 8
 
 class GMaps:
     """The Gmaps data manager for the Geocode class."""
@@ -29,9 +30,9 @@ class GMaps:
         self.gmaps_key = None
         self.gmaps_client = None
         self.cache_file = "gmaps_cache"
+        self.cache = None
         self.gmaps_key_file = gmaps_key_file if gmaps_key_file is not None \
                                   else self.cache_manager.cache_dir.joinpath("key.txt")
-        self._load_cache()
         self.cache_modified = False
 
     def __enter__(self):
@@ -39,8 +40,8 @@ class GMaps:
         return self
 
     def __exit__(self, type, value, traceback):
-        """Context manager - flush GMaps cache on exit."""
-        self.flush_cache()
+        """Context manager - flush and close GMaps cache on exit."""
+        self.close_cache()
 
     def _load_key(self):
         """Load the user's GMaps API key from installation directory."""
@@ -57,7 +58,15 @@ class GMaps:
     def flush_cache(self):
         """Flush any new GMaps API queries to the GMaps cache."""
         if self.cache_modified:
-            self.cache_manager.write(self.cache_file, self.cache)
+            self.cache.commit()
+            self.cache_modified = False
+
+    def close_cache(self):
+        """Flush any new GMaps API queries to the GMaps cache and close it until it is next used."""
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        self.cache_modified = False
 
     def geocode_postcode(self, postcode: [str],
                          address: Optional[str] = None) -> Union[Tuple[float, float], List[Tuple[float, float]]]:
@@ -80,12 +89,13 @@ class GMaps:
             passed (i.e. an iterable of strings), the output will be a list of tuples which aligns
             with the input iterable.
         """
-        address = [None for a in address] if address is None else list(address)
+        address = [None for a in postcode] if address is None else list(address)
         logging.debug("Geocoding %s postcodes (%s addresses)", len(postcode), len(address))
-        results = []
-        for pc, addr in zip(postcode, address):
-            results.append(self.geocode_one(postcode=pc, address=addr))
-        return results
+        search_terms = [self._search_term(pc, addr) for pc, addr in zip(postcode, address)]
+        unique_terms = list(dict.fromkeys(search_terms))
+        geocode_results = self._query(unique_terms)
+        parsed = {term: self._parse_result(geocode_results.get(term)) for term in unique_terms}
+        return [parsed[term] for term in search_terms]
 
     def geocode_one(self, postcode: str, address: Optional[str] = None) -> pd.Series:
         """
@@ -105,28 +115,102 @@ class GMaps:
             match_status (int). The status code shows the quality of the postcode lookup - use the
             class attribute *self.status_codes* (a dict) to get a string representation.
         """
+        search_term = self._search_term(postcode, address)
+        return self._parse_result(self._query([search_term]).get(search_term))
+
+    @staticmethod
+    def _search_term(postcode: Optional[str], address: Optional[str]) -> str:
+        """
+        Combine a postcode and/or address into a single GMaps search term, normalising case and
+        whitespace so that equivalent inputs share a cache entry.
+        """
         if postcode is None and address is None:
-            raise utils.GenericException("You must pass either postcode or address, or both.")
+            raise GenericException("You must pass either postcode or address, or both.")
+        postcode = normalise_postcode(postcode) if postcode is not None else ""
+        address = " ".join(address.lower().split()) if address is not None else ""
+        sep = ", " if address and postcode else ""
+        return f"{address}{sep}{postcode}"
+
+    @classmethod
+    def _legacy_search_terms(cls, search_term: str) -> List[str]:
+        """
+        Get the normalised search terms under which a search term from a legacy (pickled) cache
+        should be stored. Legacy search terms were not normalised and the postcode and address
+        cannot be reliably separated, so every reading of the search term is returned - each is
+        equivalent to the original search term up to case and whitespace.
+        """
+        search_terms = [cls._search_term(search_term, None), cls._search_term(None, search_term)]
+        if ", " in search_term:
+            address, postcode = search_term.rsplit(", ", 1)
+            search_terms.append(cls._search_term(postcode, address))
+        return search_terms
+
+    def _query(self, search_terms: List[str]) -> Dict[str, list]:
+        """
+        Get the GMaps API results for several unique search terms.
+
+        Parameters
+        ----------
+        `search_terms` : list of strings
+            The unique search terms to query.
+
+        Returns
+        -------
+        dict
+            Maps each search term to its GMaps API result. Terms which are not in the cache and
+            cannot be queried (i.e. because no API key is available) are omitted.
+
+        Notes
+        -----
+        The cache is probed for all of the search terms at once and only the misses are sent to
+        the GMaps API. Since the API calls are network-bound, up to `GMAPS_MAX_WORKERS` are made
+        concurrently (the googlemaps client still applies its own rate limit). New results are
+        only written to the cache from the calling thread. If any of the API calls fail, the
+        results of the others are still written to the cache before the first error is raised.
+        """
+        if self.cache is None:
+            self._load_cache()
+        geocode_results = self.cache.get_many(search_terms)
+        misses = [term for term in search_terms if term not in geocode_results]
+        if not misses:
+            return geocode_results
+        logging.debug("Loaded %s GMaps Geocoder API results from cache", len(geocode_results))
         if self.gmaps_key is None:
             self.gmaps_key = self._load_key()
             if self.gmaps_key is not None:
+                # Imported here so that users who never query the GMaps API don't pay for it
+                import googlemaps
                 self.gmaps_client = googlemaps.Client(key=self.gmaps_key)
-        if self.cache is None:
-            self._load_cache()
-        sep = ", " if address and postcode else ""
-        postcode = postcode if postcode is not None else ""
-        address = address if address is not None else ""
-        search_term = f"{address}{sep}{postcode}"
-        if search_term in self.cache:
-            logging.debug("Loading GMaps Geocoder API result from cache: '%s'", search_term)
-            geocode_result = self.cache[search_term]
-        else:
-            logging.debug("Querying Google Maps Geocoder API for '%s'", search_term)
-            if self.gmaps_key is None:
-                return pd.Series({"latitude": np.nan, "longitude": np.nan, "match_status": 0})
-            geocode_result = self.gmaps_client.geocode(search_term, region="uk")
-            self.cache[search_term] = geocode_result
+        if self.gmaps_key is None:
+            return geocode_results
+        logging.debug("Querying Google Maps Geocoder API for %s search terms", len(misses))
+        new_results = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=min(GMAPS_MAX_WORKERS, len(misses))) as executor:
+            futures = {executor.submit(self._query_gmaps, term): term for term in misses}
+            for future in as_completed(futures):
+                try:
+                    new_results[futures[future]] = future.result()
+                except Exception as e:
+                    # Keep going so that the results which have already been paid for are cached
+                    if error is None:
+                        error = e
+        if new_results:
+            self.cache.update(new_results)
             self.cache_modified = True
+        if error is not None:
+            raise error
+        geocode_results.update(new_results)
+        return geocode_results
+
+    def _query_gmaps(self, search_term: str) -> list:
+        """Query the GMaps Geocoder API for a single search term."""
+        logging.debug("Querying Google Maps Geocoder API for '%s'", search_term)
+        return self.gmaps_client.geocode(search_term, region="uk")
+
+    @staticmethod
+    def _parse_result(geocode_result: Optional[list]) -> pd.Series:
+        """Extract the location from a GMaps API result, if it is precise enough to use."""
         if not geocode_result or len(geocode_result) > 1:
             return pd.Series({"latitude": np.nan, "longitude": np.nan, "match_status": 0})
         geometry = geocode_result[0]["geometry"]
@@ -140,8 +224,7 @@ class GMaps:
 
     def _load_cache(self):
         """Load the cache of prior addresses/postcodes for better performance."""
-        self.cache = self.cache_manager.retrieve(self.cache_file)
-        if self.cache is None:
-            self.cache = {}
+        self.cache = self.cache_manager.open_sqlite(self.cache_file,
+                                                    migrate_key=self._legacy_search_terms)
         return
 
@@ -14,6 +14,7 @@ import json
 from pathlib import Path
 from typing import Optional, Iterable, Tuple, Union, List, Dict
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 try:
@@ -37,7 +38,9 @@ class NationalGrid:
         self.gsp_boundaries_20181031_cache_file = "gsp_boundaries_20181031"
         self.dno_boundaries_cache_file = "dno_boundaries"
         self.gsp_regions = None
+        self.gsp_tree = None
         self.gsp_regions_20181031 = None
+        self.gsp_tree_20181031 = None
         self.dno_regions = None
         self.gsp_lookup_20181031 = None
 
@@ -85,7 +88,7 @@ class NationalGrid:
         eso_url = "https://data.nationalgrideso.com/backend/dataset/2810092e-d4b2-472f-b955-d8bea01f9ec0/resource/08534dae-5408-4e31-8639-b579c8f1c50b/download/gsp_regions_20220314.geojson"
         success, api_response = utils.fetch_from_api(eso_url)
         if success:
-            raw = json.loads(api_response.text)
+            raw = utils.json_loads(api_response.content)
             gsp_regions = gpd.GeoDataFrame.from_features(raw["features"],
                                                          crs=raw["crs"]["properties"]["name"])
             gsp_regions.geometry = gsp_regions.buffer(0)
@@ -118,7 +121,7 @@ class NationalGrid:
         eso_url = "http://data.nationalgrideso.com/backend/dataset/0e377f16-95e9-4c15-a1fc-49e06a39cfa0/resource/e96db306-aaa8-45be-aecd-65b34d38923a/download/dno_license_areas_20200506.geojson"
         success, api_response = utils.fetch_from_api(eso_url)
         if success:
-            raw = json.loads(api_response.text)
+            raw = utils.json_loads(api_response.content)
             dno_regions = {}
             dno_names = {}
             for f in raw["features"]:
@@ -158,14 +161,17 @@ class NationalGrid:
         logging.debug("Reverse geocoding %s latlons to 20220314 GSP", len(latlons))
         if self.gsp_regions is None:
             self.gsp_regions = self._load_gsp_boundaries_20220314()
-        lats = [l[0] for l in latlons]
-        lons = [l[1] for l in latlons]
+        if self.gsp_tree is None:
+            self.gsp_tree = utils.build_strtree(self.gsp_regions)
+        latlons = np.asarray(latlons, dtype=np.float64).reshape(-1, 2)
+        lats, lons = latlons[:, 0], latlons[:, 1]
         # Rather than re-project the region boundaries, re-project the input lat/lons
         # (easier, but slightly slower if reverse-geocoding a lot)
         logging.debug("Converting latlons to BNG")
         eastings, northings = utils.latlon2bng(lons, lats)
         logging.debug("Reverse geocoding")
-        results = utils.reverse_geocode(list(zip(northings, eastings)), self.gsp_regions)
+        results = utils.reverse_geocode_strtree(np.column_stack((northings, eastings)),
+                                                *self.gsp_tree)
         return results
 
     def reverse_geocode_gsp_20181031(self,
@@ -195,10 +201,13 @@ class NationalGrid:
         """
         if self.gsp_regions_20181031 is None:
             self.gsp_regions_20181031 = self.load_gsp_boundaries_20181031()
-        lats = [l[0] for l in latlons]
-        lons = [l[1] for l in latlons]
+        if self.gsp_tree_20181031 is None:
+            self.gsp_tree_20181031 = utils.build_strtree(self.gsp_regions_20181031)
+        latlons = np.asarray(latlons, dtype=np.float64).reshape(-1, 2)
+        lats, lons = latlons[:, 0], latlons[:, 1]
         eastings, northings = utils.latlon2bng(lons, lats)
-        results = utils.reverse_geocode(list(zip(northings, eastings)), self.gsp_regions_20181031)
+        results = utils.reverse_geocode_strtree(np.column_stack((northings, eastings)),
+                                                *self.gsp_tree_20181031)
         if self.gsp_lookup_20181031 is None:
             self.gsp_lookup_20181031 = self.load_gsp_lookup_20181031()
         lookup = self.gsp_lookup_20181031
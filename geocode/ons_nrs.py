@@ -12,12 +12,20 @@ import zipfile
 import json
 import csv
 import logging
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Iterable, Tuple, Union, List, Dict
 
+import numpy as np
 import pandas as pd
 import shapefile
 try:
+    import pyogrio
+    PYOGRIO_AVAILABLE = True
+except ImportError:
+    PYOGRIO_AVAILABLE = False
+try:
+    import shapely
     from shapely.geometry import shape, Point
     from shapely.ops import unary_union
 except ImportError:
@@ -28,6 +36,11 @@ from . import utilities as utils
 
 SCRIPT_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
 
+@lru_cache(maxsize=4096)
+def _normalise_name(name: str) -> str:
+    """Normalise a constituency or Local Authority District name for use as a lookup key."""
+    return name.strip().replace(" ", "").replace(",", "").lower()
+
 class ONS_NRS:
     """
     Manage data from the Office for National Statistics (ONS) and National Records Scotland (NRS).
@@ -45,6 +58,7 @@ class ONS_NRS:
         self.pc_llsoa_zipfile = data_dir.joinpath("PCD_OA_LSOA_MSOA_LAD_MAY22_UK_LU.zip")
         self.llsoa_lookup = None
         self.llsoa_regions = None
+        self.llsoa_tree = None
         self.llsoa_reverse_lookup = None
         self.constituency_lookup = None
         self.dz_lookup = None
@@ -76,30 +90,24 @@ class ONS_NRS:
         engwales_lookup = {f["properties"]["lsoa11cd"]:
                                tuple(f["geometry"]["coordinates"][::-1])
                                for page in pages for f in page["features"]}
-        codes, eastings, northings = [], [], []
-        datazones, dzeastings, dznorthings = [], [], []
         with zipfile.ZipFile(self.nrs_zipfile, "r") as nrs_zip:
             with nrs_zip.open("OutputArea2011_PWC_WGS84.csv", "r") as fid:
-                next(fid)
-                for line in fid:
-                    _, _, code, _, easting, northing = line.decode('UTF-8').strip().split(",")
-                    codes.append(code)
-                    eastings.append(float(easting))
-                    northings.append(float(northing))
+                output_areas = pd.read_csv(fid, usecols=["code", "easting", "northing"],
+                                           dtype={"code": str, "easting": np.float64,
+                                                  "northing": np.float64}, engine="c")
             with nrs_zip.open("SG_DataZone_Cent_2011.csv") as fid:
-                next(fid)
-                contents = [l.decode('UTF-8') for l in fid.readlines()]
-                for line in csv.reader(contents, quotechar="\"", delimiter=",",
-                                       quoting=csv.QUOTE_ALL, skipinitialspace=True):
-                    datazone, _, _, _, _, dzeast, dznorth = line
-                    datazones.append(datazone)
-                    dzeastings.append(float(dzeast.strip("\"")))
-                    dznorthings.append(float(dznorth.strip("\"")))
-        lons, lats = utils.bng2latlon(eastings, northings)
-        dzlons, dzlats = utils.bng2latlon(dzeastings, dznorthings)
-        scots_lookup = {code: (lat, lon) for code, lon, lat in zip(codes, lons, lats)}
-        scots_dz_lookup = {dz: (lat, lon) for dz, lon, lat in zip(datazones, dzlons, dzlats)}
-        llsoa_lookup = {**engwales_lookup, **scots_lookup, **scots_dz_lookup}
+                datazones = pd.read_csv(fid, usecols=["DataZone", "Easting", "Northing"],
+                                        dtype={"DataZone": str, "Easting": np.float64,
+                                               "Northing": np.float64},
+                                        skipinitialspace=True, engine="c")
+        # Convert the output area and data zone centroids together in a single call
+        codes = output_areas["code"].tolist() + datazones["DataZone"].tolist()
+        lons, lats = utils.bng2latlon(
+            np.concatenate((output_areas["easting"].to_numpy(), datazones["Easting"].to_numpy())),
+            np.concatenate((output_areas["northing"].to_numpy(), datazones["Northing"].to_numpy()))
+        )
+        scots_lookup = dict(zip(codes, zip(np.asarray(lats).tolist(), np.asarray(lons).tolist())))
+        llsoa_lookup = {**engwales_lookup, **scots_lookup}
         self.cache_manager.write(cache_label, llsoa_lookup)
         logging.info("LLSOA centroids extracted and pickled to file ('%s')", cache_label)
         return llsoa_lookup
@@ -110,7 +118,7 @@ class ONS_NRS:
         (England and Wales) and packaged data (Scotland).
         """
         cache_label = "llsoa_boundaries"
-        llsoa_boundaries_cache_contents = self.cache_manager.retrieve(cache_label)
+        llsoa_boundaries_cache_contents = self.cache_manager.retrieve_regions(cache_label)
         if llsoa_boundaries_cache_contents is not None:
             logging.debug("Loading LLSOA boundaries from cache ('%s')", cache_label)
             return llsoa_boundaries_cache_contents
@@ -119,19 +127,31 @@ class ONS_NRS:
         ons_url = "https://services1.arcgis.com/ESMARspQHYMw9BZ9/arcgis/rest/services/Lower_Layer_Super_Output_Areas_Dec_2011_Boundaries_Full_Extent_BFE_EW_V3_2022/FeatureServer/0/query?outFields=*&where=1%3D1&f=geojson"
         nrs_shp_file = "OutputArea2011_EoR_WGS84.shp"
         nrs_dbf_file = "OutputArea2011_EoR_WGS84.dbf"
-        pages = utils._fetch_from_ons_api(ons_url)
-        engwales_regions = {f["properties"]["LSOA11CD"]: shape(f["geometry"]).buffer(0)
-                            for page in pages for f in page["features"]}
-        with zipfile.ZipFile(self.nrs_zipfile, "r") as nrs_zip:
-            with nrs_zip.open(nrs_shp_file, "r") as shp:
-                with nrs_zip.open(nrs_dbf_file, "r") as dbf:
-                    sf = shapefile.Reader(shp=shp, dbf=dbf)
-                    scots_regions = {sr.record[1]: shape(sr.shape.__geo_interface__).buffer(0)
-                                     for sr in sf.shapeRecords()}
-        llsoa_regions = {**engwales_regions, **scots_regions}
-        llsoa_regions = {llsoacd: (llsoa_regions[llsoacd], llsoa_regions[llsoacd].bounds)
-                         for llsoacd in llsoa_regions}
-        self.cache_manager.write(cache_label, llsoa_regions)
+        region_ids, geometries = [], []
+        for page in utils._fetch_from_ons_api(ons_url):
+            for f in page["features"]:
+                region_ids.append(f["properties"]["LSOA11CD"])
+                geometries.append(shape(f["geometry"]))
+        if PYOGRIO_AVAILABLE:
+            # GDAL reads the shapefile straight out of the zip and into Shapely geometries
+            scots_regions = pyogrio.read_dataframe(f"/vsizip/{self.nrs_zipfile}/{nrs_shp_file}",
+                                                   columns=["code"])
+            region_ids += scots_regions["code"].tolist()
+            geometries += scots_regions.geometry.tolist()
+        else:
+            with zipfile.ZipFile(self.nrs_zipfile, "r") as nrs_zip:
+                with nrs_zip.open(nrs_shp_file, "r") as shp:
+                    with nrs_zip.open(nrs_dbf_file, "r") as dbf:
+                        sf = shapefile.Reader(shp=shp, dbf=dbf)
+                        for sr in sf.shapeRecords():
+                            region_ids.append(sr.record[1])
+                            geometries.append(shape(sr.shape.__geo_interface__))
+        # Repair the geometries in one vectorised call rather than one `buffer(0)` per region
+        geometries = shapely.buffer(np.array(geometries, dtype=object), 0)
+        bounds = shapely.bounds(geometries)
+        llsoa_regions = {region_id: (geometry, tuple(b))
+                         for region_id, geometry, b in zip(region_ids, geometries, bounds.tolist())}
+        self.cache_manager.write_regions(cache_label, llsoa_regions)
         logging.info("LSOA boundaries extracted and pickled to file ('%s')", cache_label)
         return llsoa_regions
 
@@ -158,12 +178,7 @@ class ONS_NRS:
             return constituency_lookup_cache_contents
         logging.info("Extracting the Constituency Centroids data (this only needs to be done "
                      "once)")
-        constituency_lookup = {}
-        with open(self.constituency_lookup_file) as fid:
-            for line in fid:
-                _, name, longitude, latitude = line.strip().split("|")
-                match_str = name.strip().replace(" ", "").replace(",", "").lower()
-                constituency_lookup[match_str] = (float(latitude), float(longitude))
+        constituency_lookup = self._read_centroids_psv(self.constituency_lookup_file)
         self.cache_manager.write("constituency_centroids", constituency_lookup)
         logging.info("Constituency lookup extracted and pickled to '%s'", "constituency_centroids")
         return constituency_lookup
@@ -197,11 +212,8 @@ class ONS_NRS:
             self.llsoa_lookup = self._load_llsoa_lookup()
         if isinstance(llsoa, str):
             return self._llsoa_centroid(llsoa)
-        results = []
-        tot = len(llsoa)
-        for i, llsoa_ in enumerate(llsoa):
-            results.append(self._llsoa_centroid(llsoa_))
-        return results
+        llsoa_lookup = self.llsoa_lookup
+        return [llsoa_lookup.get(llsoa_, (None, None)) for llsoa_ in llsoa]
 
     def reverse_geocode_llsoa(self,
                               latlons: List[Tuple[float, float]],
@@ -225,7 +237,9 @@ class ONS_NRS:
         """
         if self.llsoa_regions is None:
             self.llsoa_regions = self._load_llsoa_boundaries()
-        results = utils.reverse_geocode(latlons, self.llsoa_regions)
+        if self.llsoa_tree is None:
+            self.llsoa_tree = utils.build_strtree(self.llsoa_regions)
+        results = utils.reverse_geocode_strtree(latlons, *self.llsoa_tree)
         if datazones:
             if self.dz_lookup is None:
                 self.dz_lookup = self._load_datazone_lookup()
@@ -262,10 +276,9 @@ class ONS_NRS:
             self.constituency_lookup = self._load_constituency_lookup()
         if isinstance(constituency, str):
             return self._constituency_centroid(constituency)
-        results = []
-        for constituency_ in constituency:
-            results.append(self._constituency_centroid(constituency_))
-        return results
+        keys = [_normalise_name(c) for c in constituency]
+        constituency_lookup = self.constituency_lookup
+        return [constituency_lookup.get(key, (None, None)) for key in keys]
 
     def geocode_local_authority(self,
                                 local_authority: Union[str, Iterable[str]]
@@ -293,11 +306,9 @@ class ONS_NRS:
             self.lad_lookup = self._load_lad_lookup()
         if isinstance(local_authority, str):
             return self._lad_centroid(local_authority)
-        results = []
-        tot = len(local_authority)
-        for i, local_authority_ in enumerate(local_authority):
-            results.append(self._lad_centroid(local_authority_))
-        return results
+        keys = [_normalise_name(l) for l in local_authority]
+        lad_lookup = self.lad_lookup
+        return [lad_lookup.get(key, (None, None)) for key in keys]
 
     def postcode2llsoa(self, pcs: pd.DataFrame) -> pd.DataFrame:
         """
@@ -330,17 +341,26 @@ class ONS_NRS:
             return lad_lookup_cache_contents
         logging.info("Extracting the Local Authority District Centroids data (this only needs to "
                      "be done once)")
-        lad_lookup = {}
-        with open(self.lad_lookup_file) as fid:
-            for line in fid:
-                _, name, longitude, latitude = line.strip().split("|")
-                match_str = name.strip().replace(" ", "").replace(",", "").lower()
-                lad_lookup[match_str] = (float(latitude), float(longitude))
+        lad_lookup = self._read_centroids_psv(self.lad_lookup_file)
         self.cache_manager.write("lad_centroids", lad_lookup)
         logging.info("Local Authority District lookup extracted and pickled to '%s'",
                      "lad_centroids")
         return lad_lookup
 
+    @staticmethod
+    def _read_centroids_psv(psv_file: Path) -> Dict[str, Tuple[float, float]]:
+        """
+        Read a pipe-separated file of region code, name, longitude and latitude into a lookup of
+        normalised name -> (latitude, longitude).
+        """
+        centroids = pd.read_csv(psv_file, sep="|", header=None,
+                                names=["code", "name", "longitude", "latitude"],
+                                dtype={"name": str}, quoting=csv.QUOTE_NONE, engine="c")
+        match_strs = centroids["name"].str.strip().str.replace(" ", "", regex=False) \
+                                      .str.replace(",", "", regex=False).str.lower()
+        return dict(zip(match_strs.tolist(), zip(centroids["latitude"].tolist(),
+                                                 centroids["longitude"].tolist())))
+
     def _load_postcode_llsoa_lookup(self):
         """Load a lookup of postcode <-> LLSOA."""
         postcode_llsoa_lookup_cache_contents = self.cache_manager.retrieve("pc_llsoa_lookup")
@@ -356,16 +376,14 @@ class ONS_NRS:
     def _lad_centroid(self, local_authority):
         """Lookup the GC for a given Local Authority."""
         try:
-            match_str = local_authority.strip().replace(" ", "").replace(",", "").lower()
-            return self.lad_lookup[match_str]
+            return self.lad_lookup[_normalise_name(local_authority)]
         except KeyError:
             return None, None
 
     def _constituency_centroid(self, constituency):
         """Lookup the GC for a given constituency."""
         try:
-            match_str = constituency.strip().replace(" ", "").replace(",", "").lower()
-            return self.constituency_lookup[match_str]
+            return self.constituency_lookup[_normalise_name(constituency)]
         except KeyError:
             return None, None
 
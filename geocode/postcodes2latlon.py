@@ -47,11 +47,9 @@ def main():
         df = pd.read_csv(fid).iloc[:100]
     with Geocoder() as geo:
         results = geo.geocode_postcode(df["postcode"].to_numpy())
-        lats = [r[0] if r[0] is not None else pd.NA for r in results]
-        lons = [r[1] if r[1] is not None else pd.NA for r in results]
-        status = [geo.status_codes[r[2]] for r in results]
-    df["latitude"] = lats
-    df["longitude"] = lons
+        status = pd.Series(results["match_status"], index=df.index).map(geo.status_codes)
+    df["latitude"] = results["latitude"]
+    df["longitude"] = results["longitude"]
     df["geocode_status"] = status
     df.to_csv(options.outfile, index=False)
     print(f"Finished, time taken: {TIME.time() - timerstart:.1f} seconds")
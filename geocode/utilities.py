@@ -6,14 +6,27 @@ Utilities for the Geocode library.
 - First Authored: 2022-10-19
 """
 
+import os
 import sys
 import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 from typing import Optional, Iterable, Tuple, Union, List, Dict
 
+import numpy as np
 import pyproj
 try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+try:
+    import shapely
     from shapely.geometry import shape, Point
     from shapely.ops import unary_union
     SHAPELY_AVAILABLE = True
@@ -22,6 +35,13 @@ except ImportError:
                     "See notes in the README about installing Shapely on Windows machines.")
     SHAPELY_AVAILABLE = False
 
+from . bng_kernel import NUMBA_AVAILABLE, bng2latlon_kernel, bng2latlon_scalar
+
+PARALLEL_REVERSE_GEOCODE_MIN_POINTS = 200000
+API_TIMEOUT = 60
+_SESSION = None
+_STRTREE_WORKER_STATE = None
+
 class GenericException(Exception):
     """A generic exception for anticipated errors."""
     def __init__(self, msg, err=None):
@@ -105,6 +125,26 @@ def query_yes_no(question, default="yes"):
             return valid[choice]
         sys.stdout.write("Please respond with 'yes' or 'no' (or 'y' or 'n').\n")
 
+def normalise_postcode(postcode: Optional[str]) -> Optional[str]:
+    """
+    Normalise a postcode (or partial postcode) for use as a cache key.
+
+    Parameters
+    ----------
+    `postcode` : string
+        The postcode (or partial postcode) to normalise.
+
+    Returns
+    -------
+    string
+        The postcode in upper case with surrounding whitespace removed and internal whitespace
+        collapsed to a single space e.g. " s3  7rh" -> "S3 7RH". Non-string inputs (e.g. None or
+        NaN) are returned unchanged.
+    """
+    if not isinstance(postcode, str):
+        return postcode
+    return " ".join(postcode.upper().split())
+
 def geocode(self,
                 postcodes: Optional[Iterable[str]] = None,
                 addresses: Optional[Iterable[str]] = None) -> List[Tuple[float, float, int]]:
@@ -233,7 +273,7 @@ def reverse_geocode(coords: List[Tuple[float, float]],
     Notes
     -----
     The region bounds are used to improve performance by first scanning for potential region
-    candidates using a simple inequality, since the performance of
+    candidates using a simple (vectorised) inequality, since the performance of
     `Shapely.MultiPolygon.contains()` is not great.
     """
     if not SHAPELY_AVAILABLE:
@@ -241,57 +281,215 @@ def reverse_geocode(coords: List[Tuple[float, float]],
                                          "the installation instructions at "
                                          "https://github.com/SheffieldSolar/Geocode")
     results = []
-    tot = len(coords)
-    for i, (y, x) in enumerate(coords):
-        success = False
-        possible_matches = []
-        for reg_id in regions:
-            bounds = regions[reg_id][1]
-            if bounds[0] <= x <= bounds[2] and bounds[1] <= y <= bounds[3]:
-                possible_matches.append(reg_id)
-        for reg_id in possible_matches:
-            if regions[reg_id][0].contains(Point(x, y)):
-                results.append(reg_id)
-                success = True
+    region_ids = list(regions)
+    xmin, ymin, xmax, ymax = np.array([regions[r][1] for r in region_ids],
+                                      dtype=np.float64).reshape(-1, 4).T
+    for y, x in coords:
+        point = Point(x, y)
+        possible_matches = np.flatnonzero((xmin <= x) & (x <= xmax) & (ymin <= y) & (y <= ymax))
+        for i in possible_matches:
+            if regions[region_ids[i]][0].contains(point):
+                results.append(region_ids[i])
                 break
-        if not success:
+        else:
             results.append(None)
     return results
 
+def build_strtree(regions: Dict) -> Tuple["shapely.STRtree", np.ndarray]:
+    """
+    Build a Shapely STRtree spatial index from a dict of regions.
+
+    Parameters
+    ----------
+    `regions` : dict
+        Dict whose keys are the region IDs and whose values are a tuple containing:
+        (region_boundary, region_bounds), as used by `reverse_geocode()`.
+
+    Returns
+    -------
+    tuple
+        The STRtree and a Numpy array of the region IDs, aligned with the tree's geometries.
+
+    Notes
+    -----
+    The region boundaries are prepared (i.e. their edges are indexed by GEOS) so that repeated
+    point-in-polygon tests against them are fast.
+    """
+    region_ids = np.empty(len(regions), dtype=object)
+    region_ids[:] = list(regions)
+    geometries = np.empty(len(regions), dtype=object)
+    geometries[:] = [regions[r][0] for r in regions]
+    shapely.prepare(geometries)
+    return shapely.STRtree(geometries), region_ids
+
+def reverse_geocode_strtree(coords: List[Tuple[float, float]],
+                            tree: "shapely.STRtree",
+                            region_ids: np.ndarray,
+                            processes: Optional[int] = None) -> List:
+    """
+    Reverse-geocode x, y coordinates to regions using a Shapely STRtree.
+
+    Parameters
+    ----------
+    `coords` : list of tuples
+        A list of tuples containing (y, x).
+    `tree` : shapely.STRtree
+        Spatial index of the region boundaries, see `build_strtree()`.
+    `region_ids` : Numpy array
+        The region IDs aligned with the tree's geometries, see `build_strtree()`.
+    `processes` : int
+        Optionally specify the number of worker processes to use for large batches. Defaults to
+        the value of the environment variable `GEOCODE_REVERSE_GEOCODE_PROCESSES`, or 1 (i.e.
+        serial) if it is not set. Pass 0 to use all of the CPUs available to this process.
+
+    Returns
+    -------
+    list
+        The region IDs that the input coords fall within. Any coords which do not fall inside a
+        region will return None. Where a coord falls within several regions, the first region (in
+        the order they were passed to `build_strtree()`) is returned, as for `reverse_geocode()`.
+
+    Notes
+    -----
+    Parallelism is opt-in: where more than one process is requested, large batches (at least
+    `PARALLEL_REVERSE_GEOCODE_MIN_POINTS` coords) are split into chunks which are
+    reverse-geocoded in forked worker processes, which inherit the tree rather than having it
+    pickled to them. Forking a process that is running other threads is unsafe, so only enable
+    this in single-threaded programs. Where fork is unavailable (e.g. on Windows), the coords
+    are always processed serially.
+    """
+    global _STRTREE_WORKER_STATE
+    if not SHAPELY_AVAILABLE:
+        raise GenericException("Geocode was unable to import the Shapely library, follow the "
+                               "installation instructions at "
+                               "https://github.com/SheffieldSolar/Geocode")
+    if len(coords) == 0:
+        return []
+    ys, xs = np.asarray(coords, dtype=np.float64).reshape(-1, 2).T
+    if processes is None:
+        processes = int(os.environ.get("GEOCODE_REVERSE_GEOCODE_PROCESSES", 1))
+    n_workers = processes if processes > 0 else available_cpus()
+    if ys.shape[0] < PARALLEL_REVERSE_GEOCODE_MIN_POINTS or n_workers < 2 or \
+            "fork" not in multiprocessing.get_all_start_methods():
+        return _query_strtree(tree, region_ids, xs, ys).tolist()
+    bounds = np.linspace(0, ys.shape[0], n_workers + 1, dtype=int)
+    _STRTREE_WORKER_STATE = (tree, region_ids, xs, ys)
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 mp_context=multiprocessing.get_context("fork")) as executor:
+            chunks = list(executor.map(_reverse_geocode_strtree_chunk, bounds[:-1], bounds[1:]))
+    finally:
+        _STRTREE_WORKER_STATE = None
+    return np.concatenate(chunks).tolist()
+
+def available_cpus() -> int:
+    """Count the CPUs this process may run on, respecting any CPU affinity mask where supported."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def _reverse_geocode_strtree_chunk(start: int, stop: int) -> np.ndarray:
+    """Reverse-geocode a slice of the coords shared with a forked worker process."""
+    tree, region_ids, xs, ys = _STRTREE_WORKER_STATE
+    return _query_strtree(tree, region_ids, xs[start:stop], ys[start:stop])
+
+def _query_strtree(tree: "shapely.STRtree", region_ids: np.ndarray, xs: np.ndarray,
+                   ys: np.ndarray) -> np.ndarray:
+    """Find the first region containing each x, y point, returning an object array of IDs."""
+    point_idx, region_idx = tree.query(shapely.points(xs, ys))
+    inside = shapely.contains_xy(tree.geometries[region_idx], xs[point_idx], ys[point_idx])
+    point_idx, region_idx = point_idx[inside], region_idx[inside]
+    order = np.lexsort((region_idx, point_idx))
+    point_idx, first = np.unique(point_idx[order], return_index=True)
+    results = np.full(ys.shape[0], None, dtype=object)
+    results[point_idx] = region_ids[region_idx[order][first]]
+    return results
+
+def json_loads(data: bytes) -> Union[Dict, List]:
+    """
+    Parse a JSON document, using orjson if it is installed (falling back to the standard library).
+
+    Parameters
+    ----------
+    `data` : bytes
+        The raw JSON document e.g. the `content` of an API response. Passing the bytes rather than
+        the decoded text avoids decoding the whole document to a string before it is parsed.
+
+    Returns
+    -------
+    dict or list
+        The parsed JSON document.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
 def _fetch_from_ons_api(url):
-    """Download data from the ONS ARCGIS API which uses pagination."""
+    """
+    Download data from the ONS ARCGIS API which uses pagination, yielding one page at a time so
+    that only a single page of the response is ever held in memory.
+    """
     exceeded_transfer_limit = True
     offset = 0
     record_count = 2000
-    pages = []
     while exceeded_transfer_limit:
         url_ = f"{url}&resultOffset={offset}&resultRecordCount={record_count}"
         success, api_response = fetch_from_api(url_)
         if success:
-            page = json.loads(api_response.text)
+            page = json_loads(api_response.content)
             exceeded_transfer_limit = "properties" in page and \
                                       "exceededTransferLimit" in page["properties"] and \
                                       page["properties"]["exceededTransferLimit"]
-            pages.append(page)
+            yield page
             offset += record_count
         else:
             raise GenericException("Encountered an error while extracting LLSOA data from ONS API.")
-    return pages
+
+def _get_session() -> requests.Session:
+    """
+    Get the HTTP session shared by all API requests, creating it on first use. The session keeps
+    connections alive between requests and retries failed requests with a backoff.
+    """
+    global _SESSION
+    if _SESSION is None:
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _SESSION = session
+    return _SESSION
 
 def fetch_from_api(url):
     """Generic function to GET data from web API with retries."""
-    retries = 0
-    while retries < 3:
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            if response.status_code != 200:
-                retries += 1
-                continue
-            return 1, response
-        except:
-            retries += 1
-    return 0, None
+    try:
+        response = _get_session().get(url, timeout=API_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException:
+        return 0, None
+    if response.status_code != 200:
+        return 0, None
+    return 1, response
+
+_TRANSFORMERS = threading.local()
+
+def _get_transformer(crs_from: int, crs_to: int) -> pyproj.Transformer:
+    """
+    Get a (lon, lat ordered) pyproj Transformer between two EPSG codes, reusing the Transformer
+    previously created by the calling thread where possible.
+
+    Notes
+    -----
+    Creating a Transformer compiles the PROJ pipeline, which is slow relative to transforming a
+    handful of co-ordinates. Transformers are not shared between threads because they are not
+    thread-safe in older versions of pyproj.
+    """
+    if not hasattr(_TRANSFORMERS, "cache"):
+        _TRANSFORMERS.cache = {}
+    if (crs_from, crs_to) not in _TRANSFORMERS.cache:
+        _TRANSFORMERS.cache[(crs_from, crs_to)] = pyproj.Transformer.from_crs(crs_from, crs_to,
+                                                                              always_xy=True)
+    return _TRANSFORMERS.cache[(crs_from, crs_to)]
 
 def latlon2bng(lons: List[float], lats: List[float]) -> Tuple[List[float], List[float]]:
     """
@@ -317,9 +515,13 @@ def latlon2bng(lons: List[float], lats: List[float]) -> Tuple[List[float], List[
     Be careful! This method uses the same convention of ordering (eastings, northings) and
     (lons, lats) as pyproj i.e. (x, y). Elsewhere in this module the convention is typically
     (lats, lons) due to personal preference.
+    Array-like inputs are passed to pyproj as contiguous float64 arrays, which it transforms
+    without copying element by element.
     """
-    proj = pyproj.Transformer.from_crs(4326, 27700, always_xy=True)
-    eastings, northings = proj.transform(lons, lats)
+    if np.ndim(lons) > 0:
+        lons = np.ascontiguousarray(lons, dtype=np.float64)
+        lats = np.ascontiguousarray(lats, dtype=np.float64)
+    eastings, northings = _get_transformer(4326, 27700).transform(lons, lats)
     return eastings, northings
 
 def bng2latlon(eastings: Iterable[Union[float, int]],
@@ -344,8 +546,27 @@ def bng2latlon(eastings: Iterable[Union[float, int]],
         Be careful! This method uses the same convention of ordering (eastings, northings) and
         (lons, lats) as pyproj i.e. (x, y). Elsewhere in this module the convention is typically
         (lats, lons) due to personal preference.
+        By default pyproj is used, which applies the OSTN15 grid shift where it is installed. If
+        Numba is installed and the environment variable `GEOCODE_FAST_BNG2LATLON` is set, scalar
+        and 1D array inputs are instead converted using a compiled Helmert transform (see
+        `bng_kernel.bng2latlon_scalar` and `bng_kernel.bng2latlon_kernel`), which is much faster
+        but only accurate to within about 5 metres.
         """
-        proj = pyproj.Transformer.from_crs(27700, 4326, always_xy=True)
-        lons, lats = proj.transform(eastings, northings)
+        use_kernel = NUMBA_AVAILABLE and bool(os.environ.get("GEOCODE_FAST_BNG2LATLON"))
+        logging.debug("Converting BNG to lat/lon using %s",
+                      "the compiled Helmert transform" if use_kernel else "pyproj")
+        if use_kernel and np.ndim(eastings) == 0:
+            return bng2latlon_scalar(float(eastings), float(northings))
+        if use_kernel and np.ndim(eastings) == 1:
+            eastings = np.ascontiguousarray(eastings, dtype=np.float64)
+            northings = np.ascontiguousarray(northings, dtype=np.float64)
+            lons = np.empty_like(eastings)
+            lats = np.empty_like(eastings)
+            bng2latlon_kernel(eastings, northings, lons, lats)
+            return lons, lats
+        if np.ndim(eastings) > 0:
+            eastings = np.ascontiguousarray(eastings, dtype=np.float64)
+            northings = np.ascontiguousarray(northings, dtype=np.float64)
+        lons, lats = _get_transformer(27700, 4326).transform(eastings, northings)
         return lons, lats
 
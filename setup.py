@@ -85,10 +85,10 @@ setup(
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=[
         "numpy",
-        "pandas",
+        "pandas>=1.5.0",
         "googlemaps",
         "requests",
-        "shapely",
+        "shapely>=2.0",
         "pyshp",
         "pyproj",
         "geopandas",
@@ -104,6 +104,13 @@ setup(
             "sphinx",
             "numpydoc",
             "sphinx_rtd_theme"
+        ],
+        "fast": [
+            "numba",
+            "orjson",
+            "pyarrow",
+            "pyogrio",
+            "zstandard",
         ]
     },
 